@@ -9,6 +9,7 @@ from flask import Flask, send_from_directory
 from flask_cors import CORS
 from backend.routes import api_bp
 from backend.models import init_db
+from backend.catalog import catalog
 from scripts.scan_music import rescan_music_directory
 import config
 import os
@@ -25,6 +26,10 @@ CORS(app)
 # This will create the database file and tables if they don't exist
 init_db()
 
+# Optional in-memory catalog for the read-only track endpoints
+if config.CATALOG_ENABLED:
+    catalog.load()
+
 # This connects all the API routes from backend/routes.py
 app.register_blueprint(api_bp, url_prefix='/api')
 
@@ -0,0 +1,243 @@
+"""
+In-memory audio byte cache for Yurt Radio.
+
+Keeps the bytes of frequently streamed tracks in memory so repeated range
+requests don't go back to disk. Files are stored as lists of fixed-size
+chunks: a range is served by yielding the cached chunk objects directly and
+only slicing (via memoryview) the partial chunks at either edge.
+"""
+
+from collections import OrderedDict
+import os
+import threading
+import config
+
+
+class _Entry:
+    __slots__ = ('chunks', 'size', 'mtime_ns')
+
+    def __init__(self, chunks, size, mtime_ns):
+        self.chunks = chunks
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+
+class CachedFile:
+    """
+    A cache hit: the chunk list for one file plus its stat fingerprint.
+    """
+
+    __slots__ = ('chunks', 'size', 'mtime', 'mtime_ns', 'chunk_size')
+
+    def __init__(self, entry, chunk_size):
+        self.chunks = entry.chunks
+        self.size = entry.size
+        self.mtime = entry.mtime_ns / 1e9
+        self.mtime_ns = entry.mtime_ns
+        self.chunk_size = chunk_size
+
+    def iter_range(self, start, stop):
+        """
+        Yield the bytes in [start, stop) without copying whole chunks.
+
+        Args:
+            start: First byte offset (inclusive)
+            stop: Last byte offset (exclusive)
+
+        Yields:
+            bytes objects; interior chunks are the cached objects themselves
+        """
+        size = self.chunk_size
+        index = start // size
+        offset = start - index * size
+
+        while start < stop:
+            chunk = self.chunks[index]
+            end = min(len(chunk), offset + stop - start)
+            if offset == 0 and end == len(chunk):
+                yield chunk
+            else:
+                yield memoryview(chunk)[offset:end].tobytes()
+            start += end - offset
+            index += 1
+            offset = 0
+
+
+class TrackByteCache:
+    """
+    LRU cache of audio file bytes with frequency-based admission.
+
+    A file is only admitted once it has been started
+    config.STREAM_CACHE_ADMIT_AFTER times, so one-off plays never push
+    popular tracks out; the range requests that make up a single play
+    don't count. Admitted files are read into memory by a background
+    thread while requests keep being served from disk; their size is
+    reserved against the memory budget before the read starts, so
+    concurrent loads can't overshoot it. Entries are validated against
+    the file's size and mtime on every lookup, and the scanner
+    invalidates paths it rewrites.
+    """
+
+    # Bound on how many distinct paths we keep request counts for.
+    MAX_TRACKED_PATHS = 10000
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._requests = OrderedDict()
+        self._loading = set()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._reserved = 0
+        self.hits = 0
+        self.misses = 0
+        self.admissions = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def enabled():
+        return config.STREAM_CACHE_ENABLED
+
+    def get(self, path, track_start=True):
+        """
+        Look up a file, admitting it if it has become popular enough.
+
+        Args:
+            path: Full path to the audio file
+            track_start: Whether this request starts a play (no Range header,
+                or a range from byte 0); only starts count toward admission
+
+        Returns:
+            A CachedFile, or None if the file should be served from disk
+        """
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(key)
+        except OSError:
+            self.invalidate(key)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return CachedFile(entry, config.STREAM_CACHE_CHUNK_BYTES)
+                self._drop(key)
+                self.invalidations += 1
+
+            self.misses += 1
+            if not track_start or key in self._loading:
+                return None
+
+            count = self._requests.pop(key, 0) + 1
+            self._requests[key] = count
+            if len(self._requests) > self.MAX_TRACKED_PATHS:
+                self._requests.popitem(last=False)
+
+            if count < config.STREAM_CACHE_ADMIT_AFTER or st.st_size > config.STREAM_CACHE_MAX_FILE_BYTES:
+                return None
+            # Loads in flight can't be evicted; wait for them to land first
+            if self._reserved + st.st_size > config.STREAM_CACHE_MAX_BYTES:
+                return None
+            self._loading.add(key)
+            self._reserved += st.st_size
+            self._evict()
+
+        # Read in the background so no request waits on loading a whole file.
+        threading.Thread(target=self._admit, args=(key, st), daemon=True).start()
+        return None
+
+    def _admit(self, key, st):
+        entry = self._load(key, st)
+
+        with self._lock:
+            self._loading.discard(key)
+            self._reserved -= st.st_size
+            if entry is None:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._requests.pop(key, None)
+            self.admissions += 1
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock. Reserved bytes count toward the budget.
+        while self._bytes + self._reserved > config.STREAM_CACHE_MAX_BYTES and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _load(self, path, st):
+        chunk_size = config.STREAM_CACHE_CHUNK_BYTES
+        chunks = []
+        try:
+            with open(path, 'rb') as f:
+                while chunk := f.read(chunk_size):
+                    chunks.append(chunk)
+        except OSError:
+            return None
+
+        size = sum(len(c) for c in chunks)
+        if size != st.st_size:
+            # File changed while we were reading it.
+            return None
+        return _Entry(chunks, size, st.st_mtime_ns)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def invalidate(self, path):
+        """
+        Remove a file from the cache, e.g. after the scanner saw it change.
+
+        Args:
+            path: Full path to the audio file
+        """
+        key = os.path.abspath(path)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+                self.invalidations += 1
+            self._requests.pop(key, None)
+
+    def clear(self):
+        """
+        Drop every cached file and reset request counts.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._requests.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            Dictionary with hit/miss/eviction counters and memory usage
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled(),
+                'entries': len(self._entries),
+                'loading': len(self._loading),
+                'bytes': self._bytes,
+                'reserved_bytes': self._reserved,
+                'max_bytes': config.STREAM_CACHE_MAX_BYTES,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'admissions': self.admissions,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+stream_cache = TrackByteCache()
@@ -0,0 +1,267 @@
+"""
+In-process catalog snapshot for Yurt Radio.
+
+Holds the tracks table in memory as array-backed columns sorted by ID, plus
+pre-serialized JSON fragments for each track, so the read-only endpoints
+(/api/track/<id>, /api/tracks, /api/track/random) can answer without touching
+SQLite or re-encoding JSON.
+
+Static fields (title, author, paths, ...) live in the fragments. Fields that
+change while the server runs (play counts, ratings) are kept in numeric
+columns, updated in place by the services, and spliced in at serve time.
+The snapshot is reloaded and swapped atomically whenever the scanner bumps
+the catalog generation in the database.
+"""
+
+from array import array
+from bisect import bisect_left
+import json
+import random
+import threading
+import time
+from backend.models import get_db, get_catalog_generation
+import config
+
+
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _fragment(fields):
+    # JSON object body without the surrounding braces, ready to splice
+    return _encode(fields)[1:-1].encode()
+
+
+class CatalogSnapshot:
+    """
+    Immutable-shape, column-oriented copy of the tracks table.
+
+    Memory is roughly 60 bytes of columns plus the length of the two JSON
+    fragments (~200-300 bytes for typical titles/paths) per track.
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.loaded_at = time.time()
+        self.ids = array('q')
+        self.play_counts = array('l')
+        self.last_played = array('q')
+        self.rating_counts = array('l')
+        self.average_ratings = array('d')
+        # "core" = fields shared by /api/track/random and /api/track/<id>
+        self.core = bytearray()
+        self.core_offsets = array('Q', [0])
+        # "extra" = the remaining static fields of /api/track/<id>
+        self.extra = bytearray()
+        self.extra_offsets = array('Q', [0])
+
+    def append(self, row):
+        (track_id, title, author, duration, file_path, file_hash, file_size, music_root,
+         play_count, last_played, rating_count, average_rating) = row
+
+        self.ids.append(track_id)
+        self.play_counts.append(play_count or 0)
+        self.last_played.append(last_played or 0)
+        self.rating_counts.append(rating_count or 0)
+        self.average_ratings.append(average_rating or 0.0)
+
+        self.core += _fragment({'id': track_id, 'title': title, 'author': author,
+                                'duration': duration, 'file_path': file_path})
+        self.core_offsets.append(len(self.core))
+
+        self.extra += _fragment({'file_hash': file_hash, 'file_size': file_size, 'music_root': music_root})
+        self.extra_offsets.append(len(self.extra))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, track_id):
+        """
+        Find a track's row index.
+
+        Returns:
+            The index, or None if the track isn't in the snapshot
+        """
+        i = bisect_left(self.ids, track_id)
+        if i < len(self.ids) and self.ids[i] == track_id:
+            return i
+        return None
+
+    def _ratings(self, i):
+        return b',"average_rating":%s,"rating_count":%d' % (
+            _encode(round(self.average_ratings[i], 2)).encode(), self.rating_counts[i])
+
+    def track_json(self, i):
+        """
+        Full track document, as served by /api/track/<id>.
+        """
+        last_played = self.last_played[i]
+        last_played = (b'"%s"' % time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(last_played)).encode()
+                       if last_played else b'null')
+        return b''.join((
+            b'{', self.core[self.core_offsets[i]:self.core_offsets[i + 1]],
+            b',', self.extra[self.extra_offsets[i]:self.extra_offsets[i + 1]],
+            b',"play_count":%d,"last_played":%s' % (self.play_counts[i], last_played),
+            self._ratings(i), b'}',
+        ))
+
+    def random_json(self, i):
+        """
+        Track document as served by /api/track/random.
+        """
+        return b''.join((
+            b'{', self.core[self.core_offsets[i]:self.core_offsets[i + 1]],
+            self._ratings(i),
+            b',"stream_url":"/api/stream/%d"}' % self.ids[i],
+        ))
+
+    def page_json(self, page, limit):
+        """
+        Paginated listing, as served by /api/tracks.
+        """
+        total = len(self.ids)
+        start = max(0, (page - 1) * limit)
+        tracks = b','.join(self.track_json(i) for i in range(start, min(total, start + limit)))
+        return b'{"tracks":[%s],"total":%d,"page":%d,"pages":%d}' % (
+            tracks, total, page, (total + limit - 1) // limit if limit > 0 else 0)
+
+    def pick_random(self, exclude_ids=None, rng=random):
+        """
+        Pick a uniformly random track ID, avoiding exclude_ids.
+
+        Args:
+            exclude_ids: Any container supporting `in`, such as a list or a
+                session history filter
+            rng: Random source
+
+        Returns:
+            A track ID, or None if the snapshot is empty or fully excluded
+        """
+        n = len(self.ids)
+        exclude = exclude_ids if exclude_ids is not None else ()
+        if n == 0:
+            return None
+
+        for _ in range(64):
+            track_id = self.ids[rng.randrange(n)]
+            if track_id not in exclude:
+                return track_id
+
+        # Tiny library that's nearly all excluded
+        remaining = [t for t in self.ids if t not in exclude]
+        return rng.choice(remaining) if remaining else None
+
+    def memory_bytes(self):
+        columns = (self.ids, self.play_counts, self.last_played, self.rating_counts,
+                   self.average_ratings, self.core_offsets, self.extra_offsets)
+        return sum(c.itemsize * len(c) for c in columns) + len(self.core) + len(self.extra)
+
+
+def load_snapshot():
+    """
+    Read the whole tracks table into a new CatalogSnapshot.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        generation = get_catalog_generation(cursor)
+        snapshot = CatalogSnapshot(generation)
+
+        cursor.execute("""
+            SELECT id, title, author, duration, file_path, file_hash, file_size, music_root,
+                   play_count, CAST(strftime('%s', last_played) AS INTEGER), rating_count, average_rating
+            FROM tracks ORDER BY id
+        """)
+        for row in cursor:
+            snapshot.append(tuple(row))
+
+    return snapshot
+
+
+class Catalog:
+    """
+    Holder for the current snapshot.
+
+    Readers grab `catalog.snapshot()` once per request and use that object
+    throughout, so a swap mid-request can't mix two generations.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._refreshing = False
+
+    def load(self):
+        """
+        Load a fresh snapshot from the database and swap it in.
+        """
+        self._snapshot = load_snapshot()
+        self._checked_at = time.time()
+
+    def snapshot(self):
+        """
+        Get the current snapshot, or None if the catalog is disabled or not loaded.
+
+        Kicks off a background generation check every
+        config.CATALOG_REFRESH_SECONDS.
+        """
+        if not config.CATALOG_ENABLED:
+            return None
+
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - self._checked_at > config.CATALOG_REFRESH_SECONDS \
+                and not self._refreshing:
+            self._refreshing = True
+            self._checked_at = time.time()
+            threading.Thread(target=self._refresh, daemon=True).start()
+        return snapshot
+
+    def _refresh(self):
+        try:
+            with get_db() as conn:
+                generation = get_catalog_generation(conn.cursor())
+            if self._snapshot is None or generation != self._snapshot.generation:
+                self.load()
+        finally:
+            self._refreshing = False
+
+    def record_play(self, track_id):
+        """
+        Mirror update_play_count() into the current snapshot.
+        """
+        snapshot = self._snapshot
+        i = snapshot.index_of(track_id) if snapshot is not None else None
+        if i is not None:
+            snapshot.play_counts[i] += 1
+            snapshot.last_played[i] = int(time.time())
+
+    def record_rating(self, track_id, average, count):
+        """
+        Mirror a rating aggregate update into the current snapshot.
+        """
+        snapshot = self._snapshot
+        i = snapshot.index_of(track_id) if snapshot is not None else None
+        if i is not None:
+            snapshot.average_ratings[i] = average
+            snapshot.rating_counts[i] = count
+
+    def stats(self):
+        """
+        Get catalog counters.
+
+        Returns:
+            Dictionary with generation, size and memory usage
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'enabled': config.CATALOG_ENABLED, 'loaded': False}
+        return {
+            'enabled': config.CATALOG_ENABLED,
+            'loaded': True,
+            'generation': snapshot.generation,
+            'tracks': len(snapshot),
+            'memory_bytes': snapshot.memory_bytes(),
+            'loaded_at': int(snapshot.loaded_at),
+        }
+
+
+catalog = Catalog()
@@ -0,0 +1,252 @@
+"""
+Per-listener play history for Yurt Radio.
+
+Each listener session (identified by a cookie token) remembers roughly the
+last config.SESSION_HISTORY_TRACKS tracks it was given, so shuffle can
+avoid repeating them. Histories are rotating Bloom filters: a fixed number
+of generations, each a small bitset holding an equal share of the window.
+When the newest generation fills up, the oldest is cleared and becomes the
+newest. A track is "recent" if any generation contains it, so every session
+costs the same fixed-size bitset (under 1 KB by default) no matter how long
+it has been listening.
+
+False positives only mean a track is skipped as if it had been played
+recently; with the default settings that's about 2% of the library.
+Alongside the filter each session keeps its last config.MAX_RECENT_TRACKS
+track IDs exactly, so that once the filter covers most of a small library
+shuffle can still avoid immediate repeats.
+Sessions are kept in an LRU capped at config.SESSION_HISTORY_MAX_SESSIONS,
+which bounds total memory. Tokens are signed with config.SESSION_SECRET, so
+a client can't fill that LRU by making up cookies.
+"""
+
+from array import array
+import base64
+from collections import OrderedDict
+import hashlib
+import hmac
+import math
+import secrets
+import threading
+import config
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(track_id):
+    # splitmix64 finalizer: spreads sequential IDs over all 64 bits
+    z = (track_id + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+class FilterShape:
+    """
+    Sizing shared by every session's filter.
+
+    Args:
+        window: Number of recent tracks to remember (at least)
+        generations: Number of rotating generations (2 or more)
+        false_positive: Target false positive rate of the whole filter
+    """
+
+    def __init__(self, window, generations, false_positive):
+        self.generations = max(2, generations)
+        # The oldest generation is only partly inside the window at any time
+        self.capacity = max(1, math.ceil(window / (self.generations - 1)))
+        # A lookup checks every generation, so their error rates add up
+        per_generation = false_positive / self.generations
+        bits = math.ceil(-self.capacity * math.log(per_generation) / math.log(2) ** 2)
+        self.generation_bytes = (bits + 7) // 8
+        self.bits = self.generation_bytes * 8
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+
+    def positions(self, track_id):
+        # Double hashing: h1 + i*h2 gives k independent-enough positions
+        h = _mix(track_id)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+
+class RotatingBloomFilter:
+    """
+    One session's history: `generations` Bloom filters packed into one bytearray.
+    """
+
+    __slots__ = ('shape', 'bits', 'current', 'count')
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.bits = bytearray(shape.generation_bytes * shape.generations)
+        self.current = 0
+        self.count = 0
+
+    def add(self, track_id):
+        shape = self.shape
+        if self.count >= shape.capacity:
+            self.current = (self.current + 1) % shape.generations
+            base = self.current * shape.generation_bytes
+            self.bits[base:base + shape.generation_bytes] = bytes(shape.generation_bytes)
+            self.count = 0
+
+        base = self.current * shape.generation_bytes * 8
+        for p in shape.positions(track_id):
+            bit = base + p
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+    def __contains__(self, track_id):
+        shape = self.shape
+        positions = shape.positions(track_id)
+        for g in range(shape.generations):
+            base = g * shape.generation_bytes * 8
+            if all(self.bits[(base + p) >> 3] & (1 << ((base + p) & 7)) for p in positions):
+                return True
+        return False
+
+
+class ListenerHistory:
+    """
+    One session's history: a RotatingBloomFilter for the long window plus
+    the exact IDs of the last few tracks.
+
+    `track_id in history` tests the filter; `last` is the short exact list.
+    """
+
+    __slots__ = ('filter', 'last')
+
+    def __init__(self, shape):
+        self.filter = RotatingBloomFilter(shape)
+        self.last = array('q')
+
+    def add(self, track_id):
+        self.filter.add(track_id)
+        self.last.append(track_id)
+        if len(self.last) > config.MAX_RECENT_TRACKS:
+            del self.last[0]
+
+    def __contains__(self, track_id):
+        return track_id in self.filter
+
+    def recent_ids(self):
+        """
+        Get the session's last config.MAX_RECENT_TRACKS track IDs, oldest first.
+        """
+        return list(self.last)
+
+
+class SessionHistory:
+    """
+    LRU of per-session ListenerHistory objects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._shape = None
+        self.evictions = 0
+
+    @staticmethod
+    def enabled():
+        return config.SESSION_HISTORY_ENABLED
+
+    @staticmethod
+    def _sign(value):
+        digest = hmac.new(config.SESSION_SECRET.encode(), value.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:16]).rstrip(b'=').decode()
+
+    @staticmethod
+    def new_token():
+        """
+        Generate a signed session token for a new listener.
+        """
+        value = secrets.token_urlsafe(16)
+        return f"{value}.{SessionHistory._sign(value)}"
+
+    @staticmethod
+    def verify_token(token):
+        """
+        Check that a session token was issued by new_token().
+
+        Args:
+            token: Cookie value sent by the client
+
+        Returns:
+            True if the token carries a valid signature
+        """
+        value, _, signature = token.partition('.')
+        if not value or len(token) > 64:
+            return False
+        return hmac.compare_digest(signature, SessionHistory._sign(value))
+
+    def _get_shape(self):
+        if self._shape is None:
+            self._shape = FilterShape(config.SESSION_HISTORY_TRACKS, config.SESSION_HISTORY_GENERATIONS,
+                                      config.SESSION_HISTORY_FALSE_POSITIVE)
+        return self._shape
+
+    def recent(self, token):
+        """
+        Get a session's history for membership tests (`track_id in history`).
+
+        Args:
+            token: Session token from the listener's cookie
+
+        Returns:
+            The session's ListenerHistory (created empty if new)
+        """
+        with self._lock:
+            history = self._sessions.get(token)
+            if history is None:
+                history = self._sessions[token] = ListenerHistory(self._get_shape())
+                while len(self._sessions) > config.SESSION_HISTORY_MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._sessions.move_to_end(token)
+            return history
+
+    def record(self, token, track_id):
+        """
+        Remember that a session was given a track.
+
+        Args:
+            token: Session token from the listener's cookie
+            track_id: The ID of the track
+        """
+        history = self.recent(token)
+        with self._lock:
+            history.add(track_id)
+
+    def clear(self):
+        """
+        Forget every session.
+        """
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        """
+        Get history counters.
+
+        Returns:
+            Dictionary with session count, per-session and total history memory
+        """
+        shape = self._get_shape()
+        per_session = shape.generation_bytes * shape.generations + 8 * config.MAX_RECENT_TRACKS
+        with self._lock:
+            sessions = len(self._sessions)
+        return {
+            'enabled': self.enabled(),
+            'sessions': sessions,
+            'max_sessions': config.SESSION_HISTORY_MAX_SESSIONS,
+            'evictions': self.evictions,
+            'window_tracks': config.SESSION_HISTORY_TRACKS,
+            'bytes_per_session': per_session,
+            'filter_bytes': per_session * sessions,
+        }
+
+
+session_history = SessionHistory()
@@ -8,6 +8,22 @@ import sqlite3
 from contextlib import contextmanager
 import config
 import os
+import time
+
+# Rollup granularities: name -> (bucket length in seconds, bucket alignment offset).
+# Weeks start on Monday; the unix epoch was a Thursday, so shift by four days.
+ROLLUP_PERIODS = {
+    'hour': (3600, 0),
+    'day': (86400, 0),
+    'week': (7 * 86400, 4 * 86400),
+}
+
+# Client playback telemetry: metric names and histogram bin upper bounds in
+# milliseconds. Each bin is a column (le_100 ... le_10000, le_inf) of
+# telemetry_rollups, so changing the bins needs a migration.
+TELEMETRY_METRICS = ('ttfa', 'stall', 'error')
+TELEMETRY_BINS_MS = (100, 250, 500, 1000, 2500, 5000, 10000)
+TELEMETRY_BIN_COLUMNS = tuple(f'le_{b}' for b in TELEMETRY_BINS_MS) + ('le_inf',)
 
 @contextmanager
 def get_db():
@@ -24,15 +40,24 @@ def get_db():
 
     try:
         yield conn
+        conn.commit()
+
+    except BaseException:
+        # Don't commit half of a failed operation
+        conn.rollback()
+        raise
 
     finally:
-        conn.commit()
         conn.close()
 
 
 def init_db():
     """
-    Initialize the database by creating tables if they don't exist.
+    Initialize the database and bring its schema up to date.
+
+    Applies every migration in MIGRATIONS that isn't recorded in the
+    schema_version table yet, each in its own transaction, so running this
+    on every startup is cheap and safe.
     """
     # Create data directory if it doesn't exist
     os.makedirs(os.path.dirname(config.DATABASE_PATH), exist_ok=True)
@@ -40,18 +65,197 @@ def init_db():
     with get_db() as conn:
         cursor = conn.cursor()
 
+        # WAL lets stream/read requests proceed while ratings and plays are written
+        cursor.execute("PRAGMA journal_mode=WAL")
+
         cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS tracks (
-                       id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       file_path TEXT NOT NULL,
-                       file_hash TEXT UNIQUE NOT NULL,
-                       title TEXT, 
-                       author TEXT,
-                       duration INTEGER,
-                       file_size INTEGER,
-                       play_count INTEGER DEFAULT 0,
-                       last_played DATETIME)
+                       CREATE TABLE IF NOT EXISTS schema_version (
+                       version INTEGER PRIMARY KEY,
+                       description TEXT NOT NULL,
+                       applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
                        ''')
+        conn.commit()
+
+        applied = {row[0] for row in cursor.execute("SELECT version FROM schema_version")}
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the lock
+                if cursor.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone() is None:
+                    migrate(cursor)
+                    cursor.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                                   (version, description))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+
+def get_schema_version():
+    """
+    Get the newest migration applied to the database.
+
+    Returns:
+        Integer version, 0 if no migrations have run
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        row = cursor.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        return row[0] or 0
+
+
+def _migrate_base_schema(cursor):
+    # Everything created before schema versioning existed. Written with
+    # IF NOT EXISTS / _add_column so it also adopts databases from that era.
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS tracks (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   file_path TEXT NOT NULL,
+                   file_hash TEXT UNIQUE NOT NULL,
+                   title TEXT, 
+                   author TEXT,
+                   duration INTEGER,
+                   file_size INTEGER,
+                   play_count INTEGER DEFAULT 0,
+                   last_played DATETIME)
+                   ''')
+
+    # Which configured music root the file_path is relative to (NULL = config.MUSIC_DIRECTORY)
+    _add_column(cursor, 'tracks', 'music_root', 'TEXT')
+
+    # Stat fingerprint (with file_size) so rescans can skip unchanged files
+    _add_column(cursor, 'tracks', 'file_mtime_ns', 'INTEGER')
+
+    # Running rating aggregates, maintained alongside every ratings insert
+    _add_column(cursor, 'tracks', 'rating_sum', 'INTEGER DEFAULT 0')
+    _add_column(cursor, 'tracks', 'rating_count', 'INTEGER DEFAULT 0')
+    _add_column(cursor, 'tracks', 'average_rating', 'REAL DEFAULT 0')
+
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS ratings (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   track_id INTEGER NOT NULL,
+                   rating INTEGER NOT NULL CHECK(rating >= 1 AND rating <= 5),
+                   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                   FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE CASCADE)
+                   ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_track_ratings ON ratings(track_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_top_rated ON tracks(average_rating, rating_count)")
+
+    # Append-only play history; played_at is a unix timestamp
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS play_events (
+                   id INTEGER PRIMARY KEY,
+                   track_id INTEGER NOT NULL,
+                   played_at INTEGER NOT NULL)
+                   ''')
+
+    # Plays per track per time bucket; period is the bucket length in seconds
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS play_rollups (
+                   period INTEGER NOT NULL,
+                   bucket INTEGER NOT NULL,
+                   track_id INTEGER NOT NULL,
+                   plays INTEGER NOT NULL,
+                   PRIMARY KEY (period, bucket, track_id)) WITHOUT ROWID
+                   ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_play_rollups_top ON play_rollups(period, bucket, plays)")
+
+    # Plays across all tracks per time bucket
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS play_rollup_totals (
+                   period INTEGER NOT NULL,
+                   bucket INTEGER NOT NULL,
+                   plays INTEGER NOT NULL,
+                   PRIMARY KEY (period, bucket)) WITHOUT ROWID
+                   ''')
+
+    # Small key/value table; 'generation' is bumped whenever the scanner changes tracks
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS catalog_meta (
+                   key TEXT PRIMARY KEY,
+                   value INTEGER NOT NULL)
+                   ''')
+
+    # High-water mark of play_events already folded into the rollups
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS rollup_state (
+                   name TEXT PRIMARY KEY,
+                   last_event_id INTEGER NOT NULL)
+                   ''')
+
+
+def _migrate_hot_path_indexes(cursor):
+    # Most-played lookup in get_stats (MAX plus equality on play_count)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_play_count ON tracks(play_count)")
+    # Databases from before versioning may carry these; nothing filters or
+    # orders by them, and idx_tracks_last_played was rewritten on every play.
+    cursor.execute("DROP INDEX IF EXISTS idx_tracks_last_played")
+    cursor.execute("DROP INDEX IF EXISTS idx_tracks_file_path")
+
+
+def _migrate_telemetry(cursor):
+    # Client playback histograms per hour bucket, track and metric
+    bins = ', '.join(f'{c} INTEGER NOT NULL DEFAULT 0' for c in TELEMETRY_BIN_COLUMNS)
+    cursor.execute(f'''
+                   CREATE TABLE IF NOT EXISTS telemetry_rollups (
+                   metric TEXT NOT NULL,
+                   bucket INTEGER NOT NULL,
+                   track_id INTEGER NOT NULL,
+                   count INTEGER NOT NULL,
+                   total_ms INTEGER NOT NULL,
+                   max_ms INTEGER NOT NULL,
+                   {bins},
+                   PRIMARY KEY (metric, bucket, track_id)) WITHOUT ROWID
+                   ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_telemetry_track ON telemetry_rollups(track_id, metric, bucket)")
+
+
+def _migrate_track_segments(cursor):
+    # Frame-aligned segment boundaries per file content; offsets/durations are JSON lists
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS track_segments (
+                   file_hash TEXT PRIMARY KEY,
+                   segment_ms INTEGER NOT NULL,
+                   offsets TEXT NOT NULL,
+                   durations TEXT NOT NULL)
+                   ''')
+
+
+def _migrate_segment_mtime(cursor):
+    # mtime of the file the segments were computed from; with the size (the
+    # last offset) it tells whether the file changed since it was indexed
+    _add_column(cursor, 'track_segments', 'file_mtime_ns', 'INTEGER')
+
+
+# Schema migrations as (version, description, function). Append new ones at
+# the end with the next version number; never edit or reorder applied ones.
+MIGRATIONS = [
+    (1, 'base schema: tracks, ratings, play history, catalog metadata', _migrate_base_schema),
+    (2, 'play_count index; drop unused last_played and file_path indexes', _migrate_hot_path_indexes),
+    (3, 'client playback telemetry rollups', _migrate_telemetry),
+    (4, 'segment byte ranges for segmented delivery', _migrate_track_segments),
+    (5, 'file mtime for stored segment indexes', _migrate_segment_mtime),
+]
+
+
+def _add_column(cursor, table, column, definition):
+    """
+    Add a column to an existing table if it isn't there yet.
+    """
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+RANDOM_TRACK_SQL = "SELECT * FROM tracks ORDER BY RANDOM() LIMIT 1"
+RANDOM_TRACK_EXCLUDING_SQL = "SELECT * FROM tracks WHERE id NOT IN ({ids}) ORDER BY RANDOM() LIMIT 1"
+RANDOM_TRACKS_SQL = "SELECT * FROM tracks ORDER BY RANDOM() LIMIT ?"
 
 
 def get_random_track(exclude_ids=None):
@@ -69,15 +273,34 @@ def get_random_track(exclude_ids=None):
 
         if exclude_ids:
             exclude_ids_str = ','.join(map(str, exclude_ids))
-            query = f"SELECT * FROM tracks WHERE id NOT IN ({exclude_ids_str}) ORDER BY RANDOM() LIMIT 1;"
+            query = RANDOM_TRACK_EXCLUDING_SQL.format(ids=exclude_ids_str)
         else:
-            query = "SELECT * FROM tracks ORDER BY RANDOM() LIMIT 1;"
-            
+            query = RANDOM_TRACK_SQL
+
         cursor.execute(query)
         random_track = cursor.fetchone()
         return random_track
 
 
+def get_random_tracks(count):
+    """
+    Get several distinct random tracks in one query.
+
+    Args:
+        count: Number of tracks to return (fewer if the library is smaller)
+
+    Returns:
+        List of track rows
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        return cursor.execute(RANDOM_TRACKS_SQL, (count,)).fetchall()
+
+
+TRACK_BY_ID_SQL = "SELECT * FROM tracks WHERE id = ?"
+
+
 def get_track_by_id(track_id):
     """
     Get a specific track by its ID.
@@ -91,13 +314,15 @@ def get_track_by_id(track_id):
     with get_db() as conn:
         cursor = conn.cursor()
 
-        query = "SELECT * FROM tracks WHERE id = ?;"
-
-        cursor.execute(query, (track_id,))
+        cursor.execute(TRACK_BY_ID_SQL, (track_id,))
         track = cursor.fetchone()
         return track
 
 
+TRACK_COUNT_SQL = "SELECT COUNT(*) FROM tracks"
+TRACKS_PAGE_SQL = "SELECT * FROM tracks LIMIT ? OFFSET ?"
+
+
 def get_all_tracks(page=1, limit=50):
     """
     Get all tracks with pagination.
@@ -114,12 +339,9 @@ def get_all_tracks(page=1, limit=50):
     with get_db() as conn:
         cursor = conn.cursor()
 
-        query_total = "SELECT COUNT(*) FROM tracks;"
-        query_page = "SELECT * FROM tracks LIMIT ? OFFSET ?"
-
-        count = cursor.execute(query_total).fetchone()[0]
+        count = cursor.execute(TRACK_COUNT_SQL).fetchone()[0]
 
-        result = cursor.execute(query_page, (limit, offset))
+        result = cursor.execute(TRACKS_PAGE_SQL, (limit, offset))
 
         tracks_data = []
         rows = result.fetchall()
@@ -136,6 +358,10 @@ def get_all_tracks(page=1, limit=50):
         return tracks
 
 
+UPDATE_PLAY_COUNT_SQL = "UPDATE tracks SET play_count = play_count + 1, last_played = CURRENT_TIMESTAMP WHERE id = ?"
+INSERT_PLAY_EVENT_SQL = "INSERT INTO play_events (track_id, played_at) VALUES (?, ?)"
+
+
 def update_play_count(track_id):
     """
     Increment the play count and update last_played_at for a track.
@@ -146,9 +372,226 @@ def update_play_count(track_id):
     with get_db() as conn:
         cursor = conn.cursor()
 
-        statement = "UPDATE tracks SET play_count = play_count + 1, last_played = CURRENT_TIMESTAMP WHERE id = ?;"
+        cursor.execute(UPDATE_PLAY_COUNT_SQL, (track_id,))
+
+        if cursor.rowcount:
+            cursor.execute(INSERT_PLAY_EVENT_SQL, (track_id, int(time.time())))
+
+
+def bucket_start(period, timestamp):
+    """
+    Get the start of the rollup bucket containing a timestamp.
+
+    Args:
+        period: A key of ROLLUP_PERIODS ('hour', 'day' or 'week')
+        timestamp: Unix timestamp
+
+    Returns:
+        Unix timestamp of the bucket start
+    """
+    length, offset = ROLLUP_PERIODS[period]
+    return timestamp - (timestamp - offset) % length
+
+
+ROLLUP_PLAYS_SQL = """
+    INSERT INTO play_rollups (period, bucket, track_id, plays)
+    SELECT ?, played_at - (played_at - ?) % ?, track_id, COUNT(*)
+    FROM play_events e WHERE id > ? AND id <= ?
+        AND EXISTS (SELECT 1 FROM tracks t WHERE t.id = e.track_id)
+    GROUP BY 2, 3
+    ON CONFLICT(period, bucket, track_id) DO UPDATE SET plays = plays + excluded.plays
+"""
+
+ROLLUP_TOTALS_SQL = """
+    INSERT INTO play_rollup_totals (period, bucket, plays)
+    SELECT ?, played_at - (played_at - ?) % ?, COUNT(*)
+    FROM play_events WHERE id > ? AND id <= ?
+    GROUP BY 2
+    ON CONFLICT(period, bucket) DO UPDATE SET plays = plays + excluded.plays
+"""
+
+
+def roll_up_play_events():
+    """
+    Fold new play events into the hourly/daily/weekly rollups.
+
+    Only events after the stored high-water mark are read, so the cost is
+    proportional to plays since the last run. The whole job runs in one
+    write transaction, so concurrent callers can't count an event twice.
+    play_events is append-only: the high-water mark relies on event IDs
+    never being reused. Per-track rollups skip tracks that have been
+    removed; the all-track totals still count their plays.
+
+    Returns:
+        Number of events rolled up
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+
+        row = cursor.execute("SELECT last_event_id FROM rollup_state WHERE name = 'plays'").fetchone()
+        low = row[0] if row else 0
+        high = cursor.execute("SELECT MAX(id) FROM play_events").fetchone()[0] or 0
+
+        if high <= low:
+            return 0
+        events = cursor.execute("SELECT COUNT(*) FROM play_events WHERE id > ? AND id <= ?", (low, high)).fetchone()[0]
+
+        for length, offset in ROLLUP_PERIODS.values():
+            cursor.execute(ROLLUP_PLAYS_SQL, (length, offset, length, low, high))
+            cursor.execute(ROLLUP_TOTALS_SQL, (length, offset, length, low, high))
+
+        cursor.execute("""
+            INSERT INTO rollup_state (name, last_event_id) VALUES ('plays', ?)
+            ON CONFLICT(name) DO UPDATE SET last_event_id = excluded.last_event_id
+        """, (high,))
+
+        return events
+
+
+TOP_PLAYED_SQL = """
+    SELECT r.track_id AS id, t.title, t.author, r.plays
+    FROM play_rollups r LEFT JOIN tracks t ON t.id = r.track_id
+    WHERE r.period = ? AND r.bucket = ?
+    ORDER BY r.plays DESC
+    LIMIT ?
+"""
+
+
+def get_top_played(period, bucket, limit=10):
+    """
+    Get the most played tracks within one rollup bucket.
+
+    Args:
+        period: A key of ROLLUP_PERIODS
+        bucket: Bucket start timestamp (see bucket_start)
+        limit: Maximum number of tracks to return
+
+    Returns:
+        List of {"id", "title", "author", "plays"} dictionaries
+    """
+    length = ROLLUP_PERIODS[period][0]
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        rows = cursor.execute(TOP_PLAYED_SQL, (length, bucket, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+
+PLAY_TOTALS_SQL = "SELECT bucket, plays FROM play_rollup_totals WHERE period = ? AND bucket >= ?"
+
+
+def get_play_totals(period, since):
+    """
+    Get total plays per bucket from `since` onwards.
+
+    Args:
+        period: A key of ROLLUP_PERIODS
+        since: Bucket start timestamp of the first bucket to include
+
+    Returns:
+        Dictionary mapping bucket start to number of plays (empty buckets omitted)
+    """
+    length = ROLLUP_PERIODS[period][0]
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        rows = cursor.execute(PLAY_TOTALS_SQL, (length, since))
+        return {bucket: plays for bucket, plays in rows}
+
+
+def add_telemetry(rows):
+    """
+    Merge histogram deltas into telemetry_rollups.
+
+    Rows for track IDs that aren't in the tracks table are skipped.
+
+    Args:
+        rows: List of (metric, bucket, track_id, count, total_ms, max_ms, *bin_counts)
+              tuples, with one bin count per TELEMETRY_BIN_COLUMNS entry
+    """
+    columns = ('metric', 'bucket', 'track_id', 'count', 'total_ms', 'max_ms') + TELEMETRY_BIN_COLUMNS
+    added = ('count', 'total_ms') + TELEMETRY_BIN_COLUMNS
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        cursor.executemany(f"""
+            INSERT INTO telemetry_rollups ({', '.join(columns)})
+            SELECT {', '.join('?' * len(columns))} WHERE EXISTS (SELECT 1 FROM tracks WHERE id = ?3)
+            ON CONFLICT(metric, bucket, track_id) DO UPDATE SET
+                {', '.join(f'{c} = {c} + excluded.{c}' for c in added)},
+                max_ms = MAX(max_ms, excluded.max_ms)
+        """, rows)
+
+
+_TELEMETRY_SUMS = ', '.join(f'SUM(r.{c}) AS {c}' for c in ('count', 'total_ms') + TELEMETRY_BIN_COLUMNS)
+
+TELEMETRY_BY_TRACK_SQL = f"""
+    SELECT r.track_id, t.title, t.file_path, t.file_size, {_TELEMETRY_SUMS}, MAX(r.max_ms) AS max_ms
+    FROM telemetry_rollups r LEFT JOIN tracks t ON t.id = r.track_id
+    WHERE r.metric = ? AND r.bucket >= ?
+    GROUP BY r.track_id
+    ORDER BY SUM(r.total_ms) * 1.0 / SUM(r.count) DESC, SUM(r.count) DESC
+    LIMIT ?
+"""
+
+_TELEMETRY_BY_BUCKET = f"""
+    SELECT r.bucket, {_TELEMETRY_SUMS}, MAX(r.max_ms) AS max_ms
+    FROM telemetry_rollups r
+    WHERE r.metric = ? AND r.bucket >= ?{{track_filter}}
+    GROUP BY r.bucket
+    ORDER BY r.bucket
+"""
+TELEMETRY_BY_BUCKET_SQL = _TELEMETRY_BY_BUCKET.format(track_filter='')
+TELEMETRY_BY_BUCKET_FOR_TRACK_SQL = _TELEMETRY_BY_BUCKET.format(track_filter=' AND r.track_id = ?')
+
+
+def get_telemetry_by_track(metric, since, limit=20):
+    """
+    Get telemetry totals per track from `since` onwards, worst mean first.
+
+    Args:
+        metric: One of TELEMETRY_METRICS
+        since: Bucket start timestamp of the first hour to include
+        limit: Maximum number of tracks to return
+
+    Returns:
+        List of dictionaries with track details, count, total_ms, max_ms and bin counts
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        rows = cursor.execute(TELEMETRY_BY_TRACK_SQL, (metric, since, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+
+def get_telemetry_by_bucket(metric, since, track_id=None):
+    """
+    Get telemetry totals per hour bucket from `since` onwards.
+
+    Args:
+        metric: One of TELEMETRY_METRICS
+        since: Bucket start timestamp of the first hour to include
+        track_id: Restrict to one track (None = all tracks)
+
+    Returns:
+        List of dictionaries with bucket, count, total_ms, max_ms and bin counts, oldest first
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        if track_id is None:
+            rows = cursor.execute(TELEMETRY_BY_BUCKET_SQL, (metric, since)).fetchall()
+        else:
+            rows = cursor.execute(TELEMETRY_BY_BUCKET_FOR_TRACK_SQL, (metric, since, track_id)).fetchall()
+        return [dict(row) for row in rows]
+
 
-        cursor.execute(statement, (track_id,))
+TOTAL_DURATION_SQL = "SELECT SUM(duration) FROM tracks"
+MOST_PLAYED_SQL = "SELECT * FROM tracks WHERE play_count = (SELECT MAX(play_count) FROM tracks)"
 
 
 def get_stats():
@@ -163,13 +606,9 @@ def get_stats():
     with get_db() as conn:
         cursor = conn.cursor()
 
-        query_total = "SELECT COUNT(*) FROM tracks;"
-        query_duration = "SELECT SUM(duration) FROM tracks;"
-        query_most_listened = "SELECT * FROM tracks WHERE play_count = (SELECT MAX(play_count) FROM tracks);"
-
-        total = cursor.execute(query_total).fetchone()[0]
-        duration = cursor.execute(query_duration).fetchone()[0]
-        most_played = cursor.execute(query_most_listened).fetchone()
+        total = cursor.execute(TRACK_COUNT_SQL).fetchone()[0]
+        duration = cursor.execute(TOTAL_DURATION_SQL).fetchone()[0]
+        most_played = cursor.execute(MOST_PLAYED_SQL).fetchone()
 
         stats['total_tracks'] = total
         stats['total_duration'] = duration
@@ -177,17 +616,19 @@ def get_stats():
 
         return stats
 
-def insert_track(file_path, file_hash, title, author, duration, file_size):
+def insert_track(file_path, file_hash, title, author, duration, file_size, music_root=None, file_mtime_ns=None):
     """
     Insert a new track into the database.
 
     Args:
-        file_path: Relative path to the music file
+        file_path: Path to the music file, relative to its music root
         file_hash: Computed file hash, used for syncing
         title, artist, album, genre: Metadata strings
         year: Release year (int or None)
         duration: Track duration in seconds
         file_size: File size in bytes
+        music_root: Music directory the file lives in (None = config.MUSIC_DIRECTORY)
+        file_mtime_ns: File modification time in nanoseconds
 
     Returns:
         The ID of the inserted track, or None if insert failed
@@ -195,23 +636,41 @@ def insert_track(file_path, file_hash, title, author, duration, file_size):
     with get_db() as conn:
         cursor = conn.cursor()
 
-        statement = "INSERT INTO tracks (file_path, file_hash, title, author, duration, file_size) VALUES (?, ?, ?, ?, ?, ?)"
+        statement = "INSERT INTO tracks (file_path, file_hash, title, author, duration, file_size, music_root, file_mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
 
-        cursor.execute(statement, (file_path, file_hash, title, author, duration, file_size))
+        cursor.execute(statement, (file_path, file_hash, title, author, duration, file_size, music_root, file_mtime_ns))
 
         return cursor.lastrowid
-    
-def insert_or_update_track(file_path, file_hash, title, author, duration, file_size):
+
+
+_UPSERT_TRACK = """
+    INSERT INTO tracks (file_path, file_hash, title, author, duration, file_size, music_root, file_mtime_ns)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(file_hash) DO UPDATE SET
+        file_path = excluded.file_path,
+        title = excluded.title,
+        author = excluded.author,
+        duration = excluded.duration,
+        file_size = excluded.file_size,
+        music_root = excluded.music_root,
+        file_mtime_ns = excluded.file_mtime_ns
+"""
+
+
+def insert_or_update_track(file_path, file_hash, title, author, duration, file_size, music_root=None,
+                           file_mtime_ns=None):
     """
     Upsert with file hash.
 
     Args:
-        file_path: Relative path to the music file
+        file_path: Path to the music file, relative to its music root
         file_hash: Computed file hash, used for syncing
         title, artist, album, genre: Metadata strings
         year: Release year (int or None)
         duration: Track duration in seconds
         file_size: File size in bytes
+        music_root: Music directory the file lives in (None = config.MUSIC_DIRECTORY)
+        file_mtime_ns: File modification time in nanoseconds
 
     Returns:
         The ID of the inserted track, or None if insert failed
@@ -220,22 +679,306 @@ def insert_or_update_track(file_path, file_hash, title, author, duration, file_s
     with get_db() as conn:
         cursor = conn.cursor()
 
-        cursor.execute("""
-            INSERT INTO tracks (file_path, file_hash, title, author, duration, file_size)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ON CONFLICT(file_hash) DO UPDATE SET
-                file_path = excluded.file_path,
-                title = excluded.title,
-                author = excluded.author,
-                duration = excluded.duration,
-                file_size = excluded.file_size
-        """, (file_path, file_hash, title, author, duration, file_size))
+        cursor.execute(_UPSERT_TRACK, (file_path, file_hash, title, author, duration, file_size, music_root,
+                                       file_mtime_ns))
 
         return cursor.lastrowid
 
+
+def upsert_tracks(tracks):
+    """
+    Upsert many tracks by file hash in a single transaction.
+
+    Args:
+        tracks: Iterable of (file_path, file_hash, title, author, duration,
+                file_size, music_root, file_mtime_ns) tuples
+
+    Returns:
+        Number of rows inserted or updated
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        cursor.executemany(_UPSERT_TRACK, tracks)
+
+        return cursor.rowcount
+
+UPDATE_RATING_SQL = """
+    UPDATE tracks SET
+        rating_sum = rating_sum + ?,
+        rating_count = rating_count + ?,
+        average_rating = CAST(rating_sum + ? AS REAL) / (rating_count + ?)
+    WHERE id = ?
+    RETURNING average_rating, rating_count
+"""
+
+INSERT_RATING_SQL = "INSERT INTO ratings (track_id, rating) VALUES (?, ?)"
+
+
+def submit_ratings(ratings):
+    """
+    Record a batch of ratings in a single transaction.
+
+    The running sum/count/average on each track is updated in the same
+    transaction as the ratings rows, so reads never need to aggregate.
+    Ratings for track IDs that don't exist are dropped.
+
+    Args:
+        ratings: Iterable of (track_id, rating) pairs; ratings must be 1-5
+
+    Returns:
+        Dictionary mapping each existing track_id to {"average", "count"}
+    """
+    totals = {}
+    for track_id, rating in ratings:
+        entry = totals.setdefault(track_id, [0, 0, []])
+        entry[0] += rating
+        entry[1] += 1
+        entry[2].append(rating)
+
+    results = {}
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        for track_id, (rating_sum, count, _) in totals.items():
+            row = cursor.execute(UPDATE_RATING_SQL, (rating_sum, count, rating_sum, count, track_id)).fetchone()
+
+            if row is not None:
+                results[track_id] = {"average": round(row[0], 2), "count": row[1]}
+
+        cursor.executemany(INSERT_RATING_SQL, [(track_id, r) for track_id in results for r in totals[track_id][2]])
+
+    return results
+
+
+TRACK_RATING_SQL = "SELECT average_rating, rating_count FROM tracks WHERE id = ?"
+
+
+def get_track_rating(track_id):
+    """
+    Get the average rating and rating count for a track.
+
+    Args:
+        track_id: The ID of the track
+
+    Returns:
+        {"average": 4.2, "count": 15}, or None if the track doesn't exist
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        row = cursor.execute(TRACK_RATING_SQL, (track_id,)).fetchone()
+        if row is None:
+            return None
+        return {"average": round(row[0], 2), "count": row[1]}
+
+
+TOP_RATED_SQL = """
+    SELECT * FROM tracks
+    WHERE rating_count > 0
+    ORDER BY average_rating DESC, rating_count DESC
+    LIMIT ?
+"""
+
+
+def get_top_rated_tracks(limit=10):
+    """
+    Get the highest rated tracks, ties broken by number of ratings.
+
+    Walks idx_tracks_top_rated backwards, so this reads `limit` rows
+    regardless of library size.
+
+    Args:
+        limit: Maximum number of tracks to return
+
+    Returns:
+        List of track dictionaries
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        rows = cursor.execute(TOP_RATED_SQL, (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+TRACK_SEGMENTS_SQL = """
+    SELECT t.file_path, t.music_root, s.segment_ms, s.offsets, s.durations, s.file_mtime_ns
+    FROM tracks t JOIN track_segments s ON s.file_hash = t.file_hash
+    WHERE t.file_hash = ?
+"""
+
+
+def get_track_segments(file_hash):
+    """
+    Get the stored segment index for a file, with the track it belongs to.
+
+    Args:
+        file_hash: Content hash of the audio file
+
+    Returns:
+        Row with file_path, music_root, segment_ms, offsets, durations and
+        file_mtime_ns, or None if the track is unknown or has no stored segments
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        return cursor.execute(TRACK_SEGMENTS_SQL, (file_hash,)).fetchone()
+
+
+def save_track_segments(rows):
+    """
+    Store segment indexes, replacing any computed with another segment length.
+
+    Args:
+        rows: List of (file_hash, segment_ms, offsets_json, durations_json,
+              file_mtime_ns) tuples
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        cursor.executemany("""
+            INSERT INTO track_segments (file_hash, segment_ms, offsets, durations, file_mtime_ns)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(file_hash) DO UPDATE SET
+                segment_ms = excluded.segment_ms,
+                offsets = excluded.offsets,
+                durations = excluded.durations,
+                file_mtime_ns = excluded.file_mtime_ns
+        """, rows)
+
+
+def get_catalog_generation(cursor):
+    """
+    Get the current catalog generation number.
+
+    Args:
+        cursor: An open cursor, so callers can read it in the same transaction as the tracks
+
+    Returns:
+        Integer generation, 0 if the scanner has never bumped it
+    """
+    row = cursor.execute("SELECT value FROM catalog_meta WHERE key = 'generation'").fetchone()
+    return row[0] if row else 0
+
+
+def bump_catalog_generation():
+    """
+    Signal that the tracks table changed, so in-memory catalogs reload.
+
+    Returns:
+        The new generation number
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        row = cursor.execute("""
+            INSERT INTO catalog_meta (key, value) VALUES ('generation', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1
+            RETURNING value
+        """).fetchone()
+        return row[0]
+
+
+def get_file_fingerprints():
+    """
+    Get the stored fingerprint and metadata for every track path.
+
+    Returns:
+        Dictionary mapping (music_root, file_path) to a track tuple
+        (file_path, file_hash, title, author, duration, file_size, music_root, file_mtime_ns)
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        rows = cursor.execute("""
+            SELECT file_path, file_hash, title, author, duration, file_size, music_root, file_mtime_ns FROM tracks
+        """)
+        return {(r['music_root'], r['file_path']): tuple(r) for r in rows}
+
+
+# Columns carried in a catalog manifest, in file order
+MANIFEST_COLUMNS = ('id', 'file_path', 'music_root', 'file_hash', 'title', 'author', 'duration', 'file_size',
+                    'file_mtime_ns', 'play_count', 'last_played', 'rating_sum', 'rating_count', 'average_rating')
+
+
+def iter_manifest_rows():
+    """
+    Stream every track as a dictionary of MANIFEST_COLUMNS, ordered by ID.
+
+    Yields:
+        One dictionary per track
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        for row in cursor.execute(f"SELECT {', '.join(MANIFEST_COLUMNS)} FROM tracks ORDER BY id"):
+            yield dict(row)
+
+
+# Counters that must never be NULL (an older or hand-written manifest may leave them out)
+_MANIFEST_DEFAULTS = {'play_count': 0, 'rating_sum': 0, 'rating_count': 0, 'average_rating': 0.0}
+
+
+def _with_manifest_defaults(rows):
+    for row in rows:
+        row = {column: row.get(column) for column in MANIFEST_COLUMNS}
+        for column, default in _MANIFEST_DEFAULTS.items():
+            if row[column] is None:
+                row[column] = default
+        yield row
+
+
+def import_manifest_rows(rows):
+    """
+    Bulk load manifest rows in a single transaction.
+
+    Into an empty tracks table the rows keep their IDs, so stream URLs stay
+    the same across nodes. Otherwise rows are upserted by file hash and
+    existing tracks keep their local IDs and play/rating history, and rows
+    that match what is already stored are left alone. If any row fails,
+    nothing is imported.
+
+    Args:
+        rows: Iterable of dictionaries keyed by MANIFEST_COLUMNS; missing
+            play and rating counters are imported as zero
+
+    Returns:
+        Number of rows inserted or changed
+    """
+    columns = ', '.join(MANIFEST_COLUMNS)
+    placeholders = ', '.join(f':{c}' for c in MANIFEST_COLUMNS)
+    rows = _with_manifest_defaults(rows)
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+
+        if cursor.execute("SELECT COUNT(*) FROM tracks").fetchone()[0] == 0:
+            cursor.executemany(f"INSERT INTO tracks ({columns}) VALUES ({placeholders})", rows)
+        else:
+            insert = [c for c in MANIFEST_COLUMNS if c != 'id']
+            static = ('file_path', 'music_root', 'title', 'author', 'duration', 'file_size', 'file_mtime_ns')
+            cursor.executemany(f"""
+                INSERT INTO tracks ({', '.join(insert)}) VALUES ({', '.join(f':{c}' for c in insert)})
+                ON CONFLICT(file_hash) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in static)}
+                WHERE ({', '.join(static)}) IS NOT ({', '.join(f'excluded.{c}' for c in static)})
+            """, rows)
+
+        return cursor.rowcount
+
+
+# Tables keyed by track_id whose rows go away with the track. play_events is
+# not one of them: it is an append-only log, and deleting its newest rows
+# would let SQLite hand their IDs to new plays below the rollup high-water mark.
+TRACK_DEPENDENT_TABLES = ('ratings', 'play_rollups', 'telemetry_rollups')
+
+
 def del_by_unseen_hash(seen_hashes):
     """
-    Removes hashes not present in seen_hashes
+    Removes hashes not present in seen_hashes, along with the ratings, play
+    rollups and telemetry of the removed tracks. Their raw play events are
+    kept, since play_events is append-only.
 
     Args:
         seen_hashes: set of hashes from the music dir
@@ -250,6 +993,18 @@ def del_by_unseen_hash(seen_hashes):
         to_remove = db_hashes - seen_hashes
 
         if to_remove:
-            cursor.executemany("DELETE FROM tracks WHERE file_hash = ?", [(h,) for h in to_remove])
-            return cursor.rowcount
+            params = [(h,) for h in to_remove]
+
+            # Foreign keys aren't enforced (and most of these tables don't
+            # declare one), so clear dependent rows explicitly, one pass each
+            cursor.execute("CREATE TEMP TABLE removed_tracks (id INTEGER PRIMARY KEY)")
+            cursor.executemany("INSERT INTO removed_tracks SELECT id FROM tracks WHERE file_hash = ?", params)
+            for table in TRACK_DEPENDENT_TABLES:
+                cursor.execute(f"DELETE FROM {table} WHERE track_id IN (SELECT id FROM removed_tracks)")
+            cursor.execute("DROP TABLE removed_tracks")
+
+            cursor.executemany("DELETE FROM tracks WHERE file_hash = ?", params)
+            removed = cursor.rowcount
+            cursor.executemany("DELETE FROM track_segments WHERE file_hash = ?", params)
+            return removed
         return 0
@@ -0,0 +1,89 @@
+"""
+Background play history rollups for Yurt Radio.
+
+Plays are appended to play_events as they happen; a background thread folds
+new events into the hourly/daily/weekly rollups every
+config.PLAY_ROLLUP_SECONDS, so reading /api/stats/history never takes the
+write lock. A failed run is rolled back and retried from the same
+high-water mark on the next one.
+"""
+
+import logging
+import threading
+import time
+from backend.models import roll_up_play_events
+import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class PlayRollupJob:
+    """
+    Periodic roll_up_play_events() on a lazily started daemon thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.runs = 0
+        self.errors = 0
+        self.events = 0
+        self.last_run_at = None
+
+    def ensure_started(self):
+        """
+        Start the background thread if it isn't running yet.
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(config.PLAY_ROLLUP_SECONDS)
+            self.run_once()
+
+    def run_once(self):
+        """
+        Roll up the play events recorded since the last run.
+
+        Returns:
+            Number of events rolled up (0 on failure)
+        """
+        try:
+            events = roll_up_play_events()
+        except Exception:
+            logger.exception("Play rollup failed; will retry")
+            with self._lock:
+                self.errors += 1
+            return 0
+
+        with self._lock:
+            self.runs += 1
+            self.events += events
+            self.last_run_at = int(time.time())
+        return events
+
+    def stats(self):
+        """
+        Get rollup job counters.
+
+        Returns:
+            Dictionary with run, error and event counts
+        """
+        with self._lock:
+            return {
+                'running': self._thread is not None,
+                'interval_seconds': config.PLAY_ROLLUP_SECONDS,
+                'runs': self.runs,
+                'errors': self.errors,
+                'events': self.events,
+                'last_run_at': self.last_run_at,
+            }
+
+
+play_rollups = PlayRollupJob()
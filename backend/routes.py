@@ -4,13 +4,24 @@ API routes for Yurt Radio.
 This file defines all the HTTP endpoints for the backend API.
 """
 
-from flask import Blueprint, jsonify, send_file, request
-from backend.services import TrackService
-from backend.models import get_track_by_id, get_all_tracks, get_stats
-from backend.utils import get_mimetype
+from flask import Blueprint, Response, jsonify, send_file, request
+from backend.services import TrackService, RatingService
+from backend.models import get_track_by_id, get_all_tracks, get_stats, get_track_rating, get_top_rated_tracks
+from backend.models import ROLLUP_PERIODS, bucket_start, get_top_played, get_play_totals
+from backend.models import TELEMETRY_METRICS, TELEMETRY_BIN_COLUMNS, get_telemetry_by_track, get_telemetry_by_bucket
+from backend.cache import stream_cache
+from backend.catalog import catalog
+from backend.shaping import stream_shaper
+from backend.telemetry import telemetry, histogram_percentile
+from backend.segments import ensure_segment_index, get_segment_index, SegmentIndex
+from backend.history import session_history
+from backend.rollups import play_rollups
+from backend.utils import get_mimetype, resolve_track_path, file_etag, is_valid_track_id
+from werkzeug.datastructures import ContentRange
 import config
 import json
 import os
+import time
 
 # ---- Imagery constants ----
 _ROUTES_DIR    = os.path.dirname(os.path.abspath(__file__))
@@ -34,6 +45,9 @@ def random_track():
     """
     Get a random track.
 
+    Listeners are identified by a session cookie (set on the first call) so
+    each one avoids repeating their own recent tracks.
+
     Returns:
         JSON: Track metadata including stream URL
 
@@ -47,18 +61,43 @@ def random_track():
             ...
         }
     """
-    track = TrackService.get_next_track()
-    if track:
-        return jsonify({
+    session = request.cookies.get(config.SESSION_COOKIE_NAME) if session_history.enabled() else None
+    if session is not None and not session_history.verify_token(session):
+        # Forged or stale (e.g. signed with an old secret): start over
+        session = None
+    new_session = session_history.enabled() and not session
+    if new_session:
+        session = session_history.new_token()
+    # A client we haven't seen (or that drops cookies) has no history yet;
+    # pick against the global recent list rather than an empty filter, and
+    # don't spend an LRU slot on it until it comes back with the cookie.
+    history_session = None if new_session else session
+
+    snapshot = catalog.snapshot()
+    if snapshot is not None:
+        track_id = TrackService.get_next_track_id(snapshot, history_session)
+        if track_id is None:
+            return {"error": "Not found"}, 404
+        rv = Response(snapshot.random_json(snapshot.index_of(track_id)), mimetype='application/json')
+    else:
+        track = TrackService.get_next_track(history_session)
+        if not track:
+            return {"error": "Not found"}, 404
+        rv = jsonify({
             "id": track['id'],
             "title": track['title'],
             "author": track['author'],
             "duration": track['duration'],
             "file_path": track['file_path'],
+            "average_rating": round(track['average_rating'], 2),
+            "rating_count": track['rating_count'],
             "stream_url": f"/api/stream/{track['id']}"
         })
-    else:
-        return {"error": "Not found"}, 404
+
+    if new_session:
+        rv.set_cookie(config.SESSION_COOKIE_NAME, session, max_age=config.SESSION_COOKIE_MAX_AGE,
+                      httponly=True, samesite='Lax')
+    return rv
 
 
 @api_bp.route('/stream/<int:track_id>', methods=['GET'])
@@ -73,14 +112,170 @@ def stream_track(track_id):
         Audio file with proper headers for streaming
     """
     track = get_track_by_id(track_id)
-    if track:
-        track_path = os.path.join(config.MUSIC_DIRECTORY, track['file_path'])
-        if os.path.exists(track_path):
-            return send_file(track_path, mimetype=get_mimetype(track_path), conditional=True)
-        else:
-            return {"error": "Track Not Found"}, 404
-    else:
+    if not track:
+        return {"error": "Track ID Invalid"}, 404
+
+    track_path = resolve_track_path(track)
+    if not os.path.exists(track_path):
+        return {"error": "Track Not Found"}, 404
+
+    if not stream_shaper.enabled():
+        return _send_track(track_path)
+
+    client = stream_shaper.open_stream(request.remote_addr)
+    if client is None:
+        return {"error": "Too many concurrent streams"}, 429, {"Retry-After": "1"}
+
+    try:
+        rv = _send_track(track_path)
+    except BaseException:
+        stream_shaper.close_stream(client)
+        raise
+
+    if rv.status_code not in (200, 206):
+        stream_shaper.close_stream(client)
+        return rv
+
+    start = rv.content_range.start if rv.status_code == 206 else 0
+    priority = stream_shaper.is_playback_head(client, track_id, start)
+    rv.response = stream_shaper.shape(rv.response, client, track_id, start, priority)
+    return rv
+
+
+def _send_track(track_path):
+    mimetype = get_mimetype(track_path)
+    if stream_cache.enabled():
+        # Only a play's first request counts toward cache admission
+        byte_range = request.range
+        track_start = byte_range is None or byte_range.ranges[0][0] == 0
+        cached = stream_cache.get(track_path, track_start)
+        if cached is not None:
+            return _send_cached(cached, mimetype)
+
+    st = os.stat(track_path)
+    return send_file(track_path, mimetype=mimetype, conditional=True,
+                     etag=file_etag(st.st_size, st.st_mtime_ns))
+
+
+def _send_cached(cached, mimetype):
+    """
+    Build a (possibly partial) response from a cached file.
+
+    Mirrors the conditional/range behaviour of send_file, but slices the
+    cached chunks instead of seeking in the file.
+    """
+    rv = Response(mimetype=mimetype, direct_passthrough=True)
+    rv.accept_ranges = 'bytes'
+    rv.last_modified = cached.mtime
+    rv.set_etag(file_etag(cached.size, cached.mtime_ns))
+    rv.cache_control.no_cache = True
+
+    etag = rv.get_etag()[0]
+    if request.if_none_match.contains(etag):
+        rv.status_code = 304
+        return rv
+
+    byte_range = request.range
+    if byte_range is not None and request.if_range.etag not in (None, etag):
+        byte_range = None
+
+    start, stop = 0, cached.size
+    if byte_range is not None:
+        span = byte_range.range_for_length(cached.size)
+        if span is None:
+            rv.status_code = 416
+            rv.content_range = ContentRange('bytes', None, None, cached.size)
+            return rv
+        start, stop = span
+        rv.status_code = 206
+        rv.content_range = ContentRange('bytes', start, stop, cached.size)
+
+    rv.response = cached.iter_range(start, stop)
+    rv.content_length = stop - start
+    return rv
+
+
+@api_bp.route('/stream/<int:track_id>/playlist.m3u8', methods=['GET'])
+def stream_playlist(track_id):
+    """
+    Get an HLS playlist of frame-aligned segments for an MP3 track.
+
+    The playlist maps a track ID to content-addressed segment URLs, so it is
+    only briefly cacheable; the segments themselves never change.
+
+    Returns:
+        application/vnd.apple.mpegurl playlist, or 404 if segmented delivery
+        is disabled or the track isn't an MP3
+    """
+    if not config.SEGMENTS_ENABLED:
+        return {"error": "Segmented delivery is disabled"}, 404
+
+    track = get_track_by_id(track_id)
+    if not track:
         return {"error": "Track ID Invalid"}, 404
+    if not os.path.exists(resolve_track_path(track)):
+        return {"error": "Track Not Found"}, 404
+
+    index = ensure_segment_index(track)
+    if index is None:
+        return {"error": "Segmented delivery is only available for MP3 tracks"}, 404
+
+    rv = Response(index.playlist(), mimetype='application/vnd.apple.mpegurl')
+    rv.set_etag(f"{index.file_hash}-{index.segment_ms}")
+    rv.cache_control.public = True
+    rv.cache_control.max_age = 60
+    return rv.make_conditional(request)
+
+
+@api_bp.route('/segment/<file_hash>/<int:segment_ms>/<int:index>.mp3', methods=['GET'])
+def stream_segment(file_hash, segment_ms, index):
+    """
+    Serve one segment listed in a track playlist.
+
+    The URL names the file content, segment length and position, so the
+    bytes behind it never change: responses are marked immutable and any
+    If-None-Match for the same URL is answered with 304 without a lookup.
+
+    Returns:
+        audio/mpeg segment, or 404 if the segment (or that segmentation) doesn't exist
+    """
+    etag = SegmentIndex.etag(file_hash, segment_ms, index)
+
+    def immutable(rv):
+        rv.set_etag(etag)
+        rv.cache_control.public = True
+        rv.cache_control.max_age = 365 * 86400
+        rv.cache_control.immutable = True
+        return rv
+
+    if request.if_none_match.contains(etag):
+        return immutable(Response(status=304))
+
+    segments = get_segment_index(file_hash) if config.SEGMENTS_ENABLED else None
+    if segments is None or segments.segment_ms != segment_ms or index >= len(segments):
+        return {"error": "Segment Not Found"}, 404
+
+    track_path = resolve_track_path({'file_path': segments.file_path, 'music_root': segments.music_root})
+    start, stop = segments.byte_range(index)
+    try:
+        # The index describes the file as scanned; don't serve a file that changed since
+        if not segments.matches(os.stat(track_path)):
+            return {"error": "Segment Not Found"}, 404
+
+        cached = stream_cache.get(track_path, index == 0) if stream_cache.enabled() else None
+        if cached is not None:
+            # Stream the cached chunks rather than joining them into a copy
+            body = cached.iter_range(start, stop)
+        else:
+            with open(track_path, 'rb') as f:
+                f.seek(start)
+                body = f.read(stop - start)
+    except OSError:
+        return {"error": "Segment Not Found"}, 404
+
+    rv = immutable(Response(body, mimetype='audio/mpeg'))
+    rv.content_length = stop - start
+    return rv.make_conditional(request, accept_ranges=True, complete_length=stop - start)
 
 
 @api_bp.route('/tracks', methods=['GET'])
@@ -106,7 +301,15 @@ def list_tracks():
     page = request.args.get('page', 1, type=int)
     limit = request.args.get('limit', 50, type=int)
 
+    snapshot = catalog.snapshot()
+    if snapshot is not None:
+        return Response(snapshot.page_json(page, limit), mimetype='application/json')
+
     tracks = get_all_tracks(page, limit)
+    for track in tracks['tracks']:
+        track['average_rating'] = round(track['average_rating'], 2)
+        track.pop('rating_sum', None)
+        track.pop('file_mtime_ns', None)
     return jsonify(tracks)
 
 
@@ -121,13 +324,109 @@ def get_track(track_id):
     Returns:
         JSON: Track metadata
     """
+    snapshot = catalog.snapshot()
+    if snapshot is not None:
+        i = snapshot.index_of(track_id)
+        if i is None:
+            return {"error": "Track ID Not Found"}, 404
+        return Response(snapshot.track_json(i), mimetype='application/json')
+
     track = get_track_by_id(track_id)
     if track:
-            return jsonify(track)
+        track = dict(track)
+        track['average_rating'] = round(track['average_rating'], 2)
+        track.pop('rating_sum')
+        track.pop('file_mtime_ns', None)
+        return jsonify(track)
     else:
         return {"error": "Track ID Not Found"}, 404
 
 
+@api_bp.route('/track/<int:track_id>/rate', methods=['POST'])
+def rate_track(track_id):
+    """
+    Rate a track from 1 to 5 stars.
+
+    Request body:
+        {"rating": 4}
+
+    Returns:
+        JSON: {"success": true, "new_average": 4.2, "total_ratings": 16}
+    """
+    body = request.get_json(silent=True) or {}
+    rating = body.get('rating')
+    if not RatingService.is_valid_rating(rating):
+        return {"error": "Rating must be an integer from 1 to 5"}, 400
+    if not is_valid_track_id(track_id):
+        return {"error": "Track ID Not Found"}, 404
+
+    result = RatingService.submit(track_id, rating)
+    if result is None:
+        return {"error": "Track ID Not Found"}, 404
+
+    return jsonify({"success": True, "new_average": result['average'], "total_ratings": result['count']})
+
+
+@api_bp.route('/ratings', methods=['POST'])
+def rate_tracks():
+    """
+    Submit a batch of ratings in one request.
+
+    Request body:
+        {"ratings": [{"track_id": 1, "rating": 5}, {"track_id": 7, "rating": 3}]}
+
+    Returns:
+        JSON: {"accepted": 2, "rejected": 0, "tracks": {"1": {"average": 4.5, "count": 2}, ...}}
+    """
+    body = request.get_json(silent=True) or {}
+    entries = body.get('ratings')
+    if not isinstance(entries, list) or len(entries) > config.MAX_RATINGS_PER_BATCH:
+        return {"error": f"ratings must be a list of at most {config.MAX_RATINGS_PER_BATCH} entries"}, 400
+
+    valid = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        track_id = entry.get('track_id')
+        if is_valid_track_id(track_id) and RatingService.is_valid_rating(entry.get('rating')):
+            valid.append((track_id, entry['rating']))
+
+    results = RatingService.submit_many(valid) if valid else []
+    tracks = {str(track_id): result for (track_id, _), result in zip(valid, results) if result is not None}
+    accepted = sum(1 for result in results if result is not None)
+
+    return jsonify({"accepted": accepted, "rejected": len(entries) - accepted, "tracks": tracks})
+
+
+@api_bp.route('/track/<int:track_id>/rating', methods=['GET'])
+def track_rating(track_id):
+    """
+    Get the rating summary for a track.
+
+    Returns:
+        JSON: {"average": 4.2, "count": 15}
+    """
+    rating = get_track_rating(track_id)
+    if rating is None:
+        return {"error": "Track ID Not Found"}, 404
+    return jsonify(rating)
+
+
+@api_bp.route('/tracks/top-rated', methods=['GET'])
+def top_rated_tracks():
+    """
+    List the highest rated tracks.
+
+    Query parameters:
+        limit: Number of tracks (default: 10, max: 100)
+
+    Returns:
+        JSON: List of track metadata
+    """
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    return jsonify(get_top_rated_tracks(limit))
+
+
 @api_bp.route('/stats', methods=['GET'])
 def get_collection_stats():
     """
@@ -139,6 +438,166 @@ def get_collection_stats():
     return jsonify(get_stats())
 
 
+@api_bp.route('/stats/history', methods=['GET'])
+def get_play_history():
+    """
+    Get play history from the time-bucketed rollups.
+
+    The rollups are brought up to date by a background job every
+    config.PLAY_ROLLUP_SECONDS, so the newest plays can take that long to appear.
+
+    Query parameters:
+        period: Bucket for top tracks - hour, day or week (default: week)
+        limit: Number of top tracks (default: 10, max: 100)
+        hours: How many hours of listens-per-hour to return (default: 24, max: 744)
+
+    Returns:
+        JSON: Top tracks in the current bucket and plays per hour
+
+    Example response:
+        {
+            "period": "week",
+            "bucket_start": 1760918400,
+            "top_tracks": [{"id": 42, "title": "...", "author": "...", "plays": 17}, ...],
+            "listens_per_hour": [{"hour": 1761001200, "plays": 3}, ...]
+        }
+    """
+    period = request.args.get('period', 'week')
+    if period not in ROLLUP_PERIODS:
+        return {"error": f"period must be one of {', '.join(ROLLUP_PERIODS)}"}, 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    hours = min(max(request.args.get('hours', 24, type=int), 1), 744)
+
+    # Covers plays from before a restart when nothing has been played since
+    play_rollups.ensure_started()
+
+    now = int(time.time())
+    current = bucket_start(period, now)
+    first_hour = bucket_start('hour', now) - (hours - 1) * 3600
+    totals = get_play_totals('hour', first_hour)
+
+    return jsonify({
+        "period": period,
+        "bucket_start": current,
+        "top_tracks": get_top_played(period, current, limit),
+        "listens_per_hour": [
+            {"hour": hour, "plays": totals.get(hour, 0)}
+            for hour in range(first_hour, first_hour + hours * 3600, 3600)
+        ]
+    })
+
+
+@api_bp.route('/telemetry', methods=['POST'])
+def submit_telemetry():
+    """
+    Accept a batch of client playback events.
+
+    Sent by radio.js with navigator.sendBeacon, so the body may arrive as
+    text/plain; it is parsed as JSON regardless of the content type.
+
+    Request body:
+        {"events": [{"type": "ttfa", "track_id": 42, "ms": 830},
+                    {"type": "stall", "track_id": 42, "ms": 1200},
+                    {"type": "error", "track_id": 42}, ...]}
+
+    Returns:
+        JSON: {"accepted": 3, "rejected": 0}, status 202
+    """
+    if not telemetry.enabled():
+        return "", 204
+
+    body = request.get_json(force=True, silent=True) or {}
+    events = body.get('events') if isinstance(body, dict) else None
+    if not isinstance(events, list) or len(events) > config.TELEMETRY_MAX_EVENTS:
+        return {"error": f"events must be a list of at most {config.TELEMETRY_MAX_EVENTS} entries"}, 400
+
+    parsed = [e for e in map(telemetry.parse_event, events) if e is not None]
+    accepted = telemetry.record(parsed) if parsed else 0
+
+    return jsonify({"accepted": accepted, "rejected": len(events) - accepted}), 202
+
+
+def _telemetry_summary(row):
+    bins = [row.pop(c) or 0 for c in TELEMETRY_BIN_COLUMNS]
+    count = row['count'] or 0
+    row['mean_ms'] = round(row.pop('total_ms') / count) if count else None
+    row['p50_ms'] = histogram_percentile(bins, 0.5)
+    row['p95_ms'] = histogram_percentile(bins, 0.95)
+    row['histogram'] = dict(zip(TELEMETRY_BIN_COLUMNS, bins))
+    return row
+
+
+@api_bp.route('/telemetry', methods=['GET'])
+def get_telemetry():
+    """
+    Get aggregated client playback telemetry.
+
+    Query parameters:
+        metric: ttfa (time to first audio), stall or error (default: ttfa)
+        hours: How many hours to cover (default: 24, max: 744)
+        track_id: Only report this track
+        limit: Number of tracks in the per-track breakdown (default: 20, max: 100)
+
+    Returns:
+        JSON: Per-hour totals and, unless track_id is given, the worst tracks
+        by mean with their format and size. Percentiles are bin upper bounds
+        (null when they fall past the last bin).
+
+    Example response:
+        {
+            "metric": "ttfa",
+            "since": 1760918400,
+            "hours": [{"bucket": 1760918400, "count": 12, "mean_ms": 640, "p50_ms": 500,
+                       "p95_ms": 2500, "max_ms": 2210, "histogram": {"le_100": 0, ...}}, ...],
+            "tracks": [{"track_id": 42, "title": "...", "file_path": "...", "format": "flac",
+                        "file_size": 31457280, "count": 3, "mean_ms": 2100, ...}, ...]
+        }
+    """
+    metric = request.args.get('metric', 'ttfa')
+    if metric not in TELEMETRY_METRICS:
+        return {"error": f"metric must be one of {', '.join(TELEMETRY_METRICS)}"}, 400
+    hours = min(max(request.args.get('hours', 24, type=int), 1), 744)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    track_id = request.args.get('track_id', type=int)
+
+    # Include whatever is still waiting for the background flush
+    telemetry.flush()
+
+    since = bucket_start('hour', int(time.time())) - (hours - 1) * 3600
+    result = {
+        "metric": metric,
+        "since": since,
+        "hours": [_telemetry_summary(row) for row in get_telemetry_by_bucket(metric, since, track_id)],
+    }
+
+    if track_id is None:
+        tracks = [_telemetry_summary(row) for row in get_telemetry_by_track(metric, since, limit)]
+        for track in tracks:
+            track['format'] = os.path.splitext(track['file_path'] or '')[1].lstrip('.').lower() or None
+        result['tracks'] = tracks
+
+    return jsonify(result)
+
+
+@api_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Get runtime counters for the streaming internals.
+
+    Returns:
+        JSON: {"stream_cache": {...}, "catalog": {...}, "stream_shaping": {...},
+               "telemetry": {...}, "session_history": {...}, "play_rollups": {...}}
+    """
+    return jsonify({
+        "stream_cache": stream_cache.stats(),
+        "catalog": catalog.stats(),
+        "stream_shaping": stream_shaper.stats(),
+        "telemetry": telemetry.stats(),
+        "session_history": session_history.stats(),
+        "play_rollups": play_rollups.stats(),
+    })
+
+
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """
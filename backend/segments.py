@@ -0,0 +1,270 @@
+"""
+Segmented MP3 delivery for Yurt Radio.
+
+Splits MP3 files into segments of roughly config.SEGMENT_SECONDS, cut at
+frame boundaries found by walking the MPEG frame headers. Segment byte
+ranges are computed at scan time (or on first request) and stored per file
+hash, so each segment has a content-addressed URL that never changes and
+can be cached by browsers and CDNs indefinitely.
+
+Segments are contiguous and cover the whole file: the first one carries any
+leading ID3v2 tag and the last any trailing ID3v1 tag, so concatenating them
+reproduces the original file. As with any frame-cut MP3, a segment's first
+frame may reference bit-reservoir data from the previous segment; decoders
+handle that as they do after a seek.
+"""
+
+import json
+import os
+from backend.models import get_track_segments, save_track_segments
+from backend.utils import resolve_track_path
+import config
+
+
+# Bitrates in kbps by (MPEG-1?, layer); index 0 is "free format", which we don't support
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates by version bits: 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5 (1 is reserved)
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def parse_frame_header(data, pos):
+    """
+    Decode the MPEG audio frame header at data[pos:pos + 4].
+
+    Args:
+        data: File contents
+        pos: Offset of the candidate header
+
+    Returns:
+        (frame_length, samples, sample_rate), or None if there is no valid header there
+    """
+    if pos + 4 > len(data):
+        return None
+    b0, b1, b2 = data[pos], data[pos + 1], data[pos + 2]
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[mpeg1, layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    if layer == 2 or mpeg1:
+        return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+    return 72 * bitrate // sample_rate + padding, 576, sample_rate
+
+
+def _id3v2_length(data):
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def iter_frames(data):
+    """
+    Walk the MPEG audio frames in an MP3 file.
+
+    Skips ID3 tags. After garbage between frames, a candidate header is only
+    accepted if another valid header follows it, so stray 0xFF bytes don't
+    produce bogus frames.
+
+    Args:
+        data: File contents
+
+    Yields:
+        (offset, samples, sample_rate) for each frame
+    """
+    pos = _id3v2_length(data)
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+
+    synced = True
+    while pos + 4 <= end:
+        header = parse_frame_header(data, pos)
+        if header is not None and pos + header[0] <= end:
+            length = header[0]
+            if synced or pos + length == end or parse_frame_header(data, pos + length) is not None:
+                yield pos, header[1], header[2]
+                pos += length
+                synced = True
+                continue
+
+        synced = False
+        pos = data.find(b'\xff', pos + 1, end)
+        if pos < 0:
+            break
+
+
+def split_mp3(data, segment_seconds):
+    """
+    Compute frame-aligned segment boundaries for an MP3 file.
+
+    Args:
+        data: File contents
+        segment_seconds: Target segment duration
+
+    Returns:
+        (offsets, durations): n + 1 byte offsets from 0 to len(data) and the
+        n segment durations in seconds, or None if no frames were found
+    """
+    offsets = [0]
+    durations = []
+    elapsed = 0.0
+
+    for pos, samples, sample_rate in iter_frames(data):
+        if elapsed >= segment_seconds:
+            offsets.append(pos)
+            durations.append(round(elapsed, 3))
+            elapsed = 0.0
+        elapsed += samples / sample_rate
+
+    if elapsed == 0.0 and not durations:
+        return None
+    offsets.append(len(data))
+    durations.append(round(elapsed, 3))
+    return offsets, durations
+
+
+def is_segmentable(file_path):
+    return os.path.splitext(file_path)[1].lower() == '.mp3'
+
+
+def segment_ms():
+    """
+    Current target segment length in milliseconds (part of every segment URL).
+    """
+    return int(config.SEGMENT_SECONDS * 1000)
+
+
+def index_file(path, file_hash):
+    """
+    Split one MP3 file and build the row to store for it.
+
+    Args:
+        path: Full path to the file
+        file_hash: Its content hash
+
+    Returns:
+        A row for save_track_segments(), or None if the file has no MP3 frames
+    """
+    with open(path, 'rb') as f:
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        result = split_mp3(f.read(), config.SEGMENT_SECONDS)
+    if result is None:
+        return None
+    offsets, durations = result
+    return file_hash, segment_ms(), json.dumps(offsets), json.dumps(durations), mtime_ns
+
+
+class SegmentIndex:
+    """
+    Segment boundaries of one file, as loaded from track_segments.
+    """
+
+    __slots__ = ('file_hash', 'segment_ms', 'offsets', 'durations', 'file_path', 'music_root', 'file_mtime_ns')
+
+    def __init__(self, file_hash, row):
+        self.file_hash = file_hash
+        self.segment_ms = row['segment_ms']
+        self.offsets = json.loads(row['offsets'])
+        self.durations = json.loads(row['durations'])
+        self.file_path = row['file_path']
+        self.music_root = row['music_root']
+        self.file_mtime_ns = row['file_mtime_ns']
+
+    def __len__(self):
+        return len(self.durations)
+
+    def byte_range(self, index):
+        return self.offsets[index], self.offsets[index + 1]
+
+    @staticmethod
+    def etag(file_hash, segment_ms, index):
+        # Static so a segment URL's ETag is known before loading its index
+        return f'{file_hash}-{segment_ms}-{index}'
+
+    def matches(self, st):
+        """
+        Whether the file is still the one this index was computed from.
+
+        Args:
+            st: os.stat() result for the track file
+        """
+        return st.st_size == self.offsets[-1] and st.st_mtime_ns == self.file_mtime_ns
+
+    def url(self, index):
+        return f'/api/segment/{self.file_hash}/{self.segment_ms}/{index}.mp3'
+
+    def playlist(self):
+        """
+        Render an HLS media playlist (VOD) listing every segment.
+        """
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{int(-(-max(self.durations) // 1))}',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            '#EXT-X-PLAYLIST-TYPE:VOD',
+        ]
+        for i, duration in enumerate(self.durations):
+            lines.append(f'#EXTINF:{duration:.3f},')
+            lines.append(self.url(i))
+        lines.append('#EXT-X-ENDLIST')
+        return '\n'.join(lines) + '\n'
+
+
+def get_segment_index(file_hash):
+    """
+    Load the stored segment index for a file.
+
+    Returns:
+        A SegmentIndex, or None if the file is unknown or not indexed yet
+    """
+    row = get_track_segments(file_hash)
+    return SegmentIndex(file_hash, row) if row is not None else None
+
+
+def ensure_segment_index(track):
+    """
+    Get a track's segment index, computing and storing it if it is missing,
+    was computed for a different segment length, or the file has changed.
+
+    Args:
+        track: Track row
+
+    Returns:
+        A SegmentIndex, or None if the track isn't an MP3 or has no frames
+    """
+    if not is_segmentable(track['file_path']):
+        return None
+
+    path = resolve_track_path(track)
+    index = get_segment_index(track['file_hash'])
+    if index is not None and index.segment_ms == segment_ms() and index.matches(os.stat(path)):
+        return index
+
+    row = index_file(path, track['file_hash'])
+    if row is None:
+        return None
+    save_track_segments([row])
+    return get_segment_index(track['file_hash'])
@@ -4,7 +4,12 @@ Business logic for Yurt Radio.
 This file contains the core logic for track selection, randomization, etc.
 """
 
-from backend.models import get_random_track, update_play_count
+from backend.models import get_random_track, get_random_tracks, get_track_by_id, update_play_count, submit_ratings
+from backend.shuffle import weighted_sampler
+from backend.catalog import catalog
+from backend.history import session_history
+from backend.rollups import play_rollups
+import threading
 import config
 
 
@@ -17,30 +22,160 @@ class TrackService:
     # This prevents the same song from playing twice in a row
     recently_played = []
 
+    # Random rows fetched per pick when filtering against a session history
+    HISTORY_CANDIDATES = 16
+
     @staticmethod
-    def get_next_track():
+    def get_next_track(session=None):
         """
         Get the next random track with smart randomization.
 
         This function:
-        1. Gets a random track from the database
-        2. Ensures it's not a recently played track
+        1. Gets a random track from the database, uniformly or through the
+           weighted sampler when config.WEIGHTED_SHUFFLE_ENABLED is set
+        2. Ensures it's not a recently played track, for this listener's
+           session if there is one, otherwise across all listeners
         3. Updates the play count
-        4. Adds it to the recently played list
+        4. Adds it to the recently played list (and the session's history)
+
+        Args:
+            session: Listener session token, or None
 
         Returns:
             A track dictionary, or None if no tracks available
         """
-        track = get_random_track(TrackService.get_recently_played())
+        history = TrackService._session_history(session)
+
+        if config.WEIGHTED_SHUFFLE_ENABLED:
+            track = TrackService._get_weighted_track(history)
+        elif history is not None:
+            track = TrackService._get_unheard_track(history)
+        else:
+            track = get_random_track(TrackService.get_recently_played())
+
+        if track is None:
+            return None
+
+        TrackService._record_play(track['id'], session)
+        return track
+
+    @staticmethod
+    def get_next_track_id(snapshot, session=None):
+        """
+        Pick the next track from an in-memory catalog snapshot.
+
+        Same selection and bookkeeping as get_next_track(), but the track row
+        is never fetched; the caller serves it from the snapshot.
+
+        Args:
+            snapshot: The CatalogSnapshot serving this request
+            session: Listener session token, or None
+
+        Returns:
+            A track ID present in the snapshot, or None if no tracks available
+        """
+        history = TrackService._session_history(session)
+        recent = history if history is not None else TrackService.get_recently_played()
+        track_id = None
+
+        if config.WEIGHTED_SHUFFLE_ENABLED:
+            track_id = weighted_sampler.pick(recent)
+            if track_id is not None and snapshot.index_of(track_id) is None:
+                weighted_sampler.invalidate()
+                track_id = None
+
+        if track_id is None:
+            track_id = snapshot.pick_random(recent)
+        if track_id is None and history is not None:
+            # The session has heard (or appears to have heard) everything;
+            # still avoid its last few tracks
+            track_id = snapshot.pick_random(history.recent_ids()) or snapshot.pick_random()
+        if track_id is None:
+            return None
+
+        TrackService._record_play(track_id, session)
+        return track_id
+
+    @staticmethod
+    def _session_history(session):
+        """
+        Get the history filter for a listener session.
 
-        update_play_count(track['id'])
+        Returns:
+            The session's ListenerHistory, or None if there is no session
+            or per-session history is disabled
+        """
+        if session is None or not session_history.enabled():
+            return None
+        return session_history.recent(session)
+
+    @staticmethod
+    def _record_play(track_id, session=None):
+        """
+        Persist a play and update every in-memory view of it.
+        """
+        update_play_count(track_id)
+        play_rollups.ensure_started()
+        weighted_sampler.record_play(track_id)
+        catalog.record_play(track_id)
+
+        if session is not None and session_history.enabled():
+            session_history.record(session, track_id)
 
-        TrackService.recently_played.append(track['id'])
+        TrackService.recently_played.append(track_id)
 
         if len(TrackService.get_recently_played()) > config.MAX_RECENT_TRACKS:
             TrackService.recently_played.pop(0)
 
-        return track
+    @staticmethod
+    def _get_unheard_track(history):
+        """
+        Pick a uniformly random track the session hasn't heard recently.
+
+        A Bloom filter can't go into a NOT IN clause, so this draws a few
+        random rows in one query and takes the first one not in the history.
+        If all of them are (small library, long session) a repeat is allowed,
+        but never of one of the session's last config.MAX_RECENT_TRACKS.
+        """
+        candidates = get_random_tracks(TrackService.HISTORY_CANDIDATES)
+        if not candidates:
+            return None
+        for track in candidates:
+            if track['id'] not in history:
+                return track
+
+        last = history.recent_ids()
+        for track in candidates:
+            if track['id'] not in last:
+                return track
+        # Library no bigger than the short list
+        return get_random_track(last) or candidates[0]
+
+    @staticmethod
+    def _get_weighted_track(history=None):
+        """
+        Pick a track through the weighted sampler.
+
+        Falls back to uniform selection if every draw was excluded (small
+        library or long session history), or if the sampler hands back a
+        track that has since been removed from the database.
+
+        Args:
+            history: Session history to avoid, or None to use the global recent list
+        """
+        recent = history if history is not None else TrackService.get_recently_played()
+        track_id = weighted_sampler.pick(recent)
+
+        if track_id is not None:
+            track = get_track_by_id(track_id)
+            if track is not None:
+                return track
+            # Deleted since the alias table was built
+            weighted_sampler.invalidate()
+
+        if history is not None:
+            return TrackService._get_unheard_track(history)
+        return get_random_track(TrackService.get_recently_played())
 
     @staticmethod
     def clear_recent_tracks():
@@ -60,3 +195,111 @@ class TrackService:
             List of track IDs
         """
         return TrackService.recently_played
+
+
+class RatingService:
+    """
+    Service class for rating submissions.
+
+    Concurrent submissions are group-committed: one request at a time acts
+    as the writer and commits every rating queued so far in a single
+    transaction, while requests arriving meanwhile wait for the next batch.
+    Under load this turns N commits into a handful. If a batch fails, each
+    request in it is retried on its own, so one bad submission only fails
+    its own request.
+    """
+
+    _cond = threading.Condition()
+    _pending = []
+    _writing = False
+
+    @staticmethod
+    def is_valid_rating(rating):
+        """
+        Check that a rating is an integer from 1 to 5.
+        """
+        return isinstance(rating, int) and not isinstance(rating, bool) and 1 <= rating <= 5
+
+    @staticmethod
+    def submit(track_id, rating):
+        """
+        Submit one rating, batching it with any concurrent submissions.
+
+        Args:
+            track_id: The ID of the track being rated
+            rating: Integer rating from 1 to 5
+
+        Returns:
+            {"average": 4.2, "count": 16}, or None if the track doesn't exist
+        """
+        return RatingService.submit_many([(track_id, rating)])[0]
+
+    @staticmethod
+    def submit_many(ratings):
+        """
+        Submit several ratings, batching them with any concurrent submissions.
+
+        Args:
+            ratings: List of (track_id, rating) pairs, already validated
+
+        Returns:
+            List of per-rating results in the same order as `ratings`;
+            each is {"average", "count"} after the batch, or None if the
+            track doesn't exist
+        """
+        request = _RatingRequest(ratings)
+        cond = RatingService._cond
+
+        with cond:
+            RatingService._pending.append(request)
+            while RatingService._writing and not request.done:
+                cond.wait()
+
+            leader = not request.done
+            if leader:
+                RatingService._writing = True
+                batch, RatingService._pending = RatingService._pending, []
+
+        if leader:
+            outcome = RatingService._commit([pair for r in batch for pair in r.ratings])
+            if outcome[1] is not None and len(batch) > 1:
+                outcomes = [RatingService._commit(r.ratings) for r in batch]
+            else:
+                outcomes = [outcome] * len(batch)
+
+            with cond:
+                for r, (totals, error) in zip(batch, outcomes):
+                    r.totals, r.error, r.done = totals, error, True
+                RatingService._writing = False
+                cond.notify_all()
+
+        if request.error is not None:
+            raise request.error
+        return [request.totals.get(track_id) for track_id, _ in ratings]
+
+
+    @staticmethod
+    def _commit(ratings):
+        """
+        Write one batch of ratings.
+
+        Returns:
+            (totals, error): submit_ratings() totals and None, or {} and the exception
+        """
+        try:
+            totals = submit_ratings(ratings)
+        except Exception as e:
+            return {}, e
+        for track_id, result in totals.items():
+            catalog.record_rating(track_id, result['average'], result['count'])
+        return totals, None
+
+
+class _RatingRequest:
+    __slots__ = ('ratings', 'totals', 'error', 'done')
+
+    def __init__(self, ratings):
+        self.ratings = ratings
+        self.totals = None
+        self.error = None
+        self.done = False
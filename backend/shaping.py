@@ -0,0 +1,235 @@
+"""
+Bandwidth shaping for audio delivery.
+
+Token buckets cap how fast each client, and the server as a whole, can pull
+audio bytes, and a per-client stream limit stops one client from opening
+dozens of downloads at once. Requests that continue playback (a range that
+starts at the beginning of a track or right where the client's last range
+ended) get their first bytes unshaped, so real listeners keep a fast
+time-to-first-byte even while a scraper is being throttled.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+import config
+
+
+class TokenBucket:
+    """
+    Token bucket that lets callers go into debt.
+
+    reserve() always succeeds and returns how long the caller should sleep
+    before sending, which keeps pacing fair without a retry loop.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, n):
+        """
+        Take n tokens.
+
+        Args:
+            n: Number of bytes about to be sent
+
+        Returns:
+            Seconds to wait before sending them (0 if within budget)
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= n
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Client:
+    __slots__ = ('bucket', 'active', 'last_track', 'last_end')
+
+    def __init__(self):
+        self.bucket = TokenBucket(config.STREAM_CLIENT_RATE, config.STREAM_CLIENT_BURST)
+        self.active = 0
+        self.last_track = None
+        self.last_end = 0
+
+
+class StreamShaper:
+    """
+    Per-client and global shaping for /api/stream responses.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._clients = OrderedDict()
+        self._global = None
+        self.throttled_bytes = 0
+        self.throttle_wait_seconds = 0.0
+        self.priority_bytes = 0
+        self.shaped_bytes = 0
+        self.rejected_streams = 0
+
+    @staticmethod
+    def enabled():
+        return config.STREAM_SHAPING_ENABLED
+
+    def _global_bucket(self):
+        if self._global is None:
+            self._global = TokenBucket(config.STREAM_GLOBAL_RATE, config.STREAM_GLOBAL_BURST)
+        return self._global
+
+    def open_stream(self, client_key):
+        """
+        Claim a stream slot for a client.
+
+        Args:
+            client_key: Client identifier, normally the remote address
+
+        Returns:
+            The client state to pass to shape()/close_stream(), or None if the
+            client already has config.STREAM_MAX_PER_CLIENT streams open
+        """
+        with self._lock:
+            client = self._clients.get(client_key)
+            if client is None:
+                client = self._clients[client_key] = _Client()
+                self._evict_idle()
+            self._clients.move_to_end(client_key)
+
+            if client.active >= config.STREAM_MAX_PER_CLIENT:
+                self.rejected_streams += 1
+                return None
+            client.active += 1
+            return client
+
+    def _evict_idle(self):
+        # Forget the least recently seen clients that have no open streams.
+        excess = len(self._clients) - config.STREAM_SHAPING_MAX_CLIENTS
+        for key in list(self._clients):
+            if excess <= 0:
+                break
+            if self._clients[key].active == 0:
+                del self._clients[key]
+                excess -= 1
+
+    def close_stream(self, client):
+        """
+        Release a stream slot claimed by open_stream().
+        """
+        with self._lock:
+            client.active -= 1
+
+    def is_playback_head(self, client, track_id, start):
+        """
+        Check whether a range request continues playback.
+
+        Args:
+            client: State returned by open_stream()
+            track_id: Track being requested
+            start: First byte of the requested range (0 for a full request)
+
+        Returns:
+            True for the start of a track or a range near where the client's
+            previous range for the same track ended
+        """
+        if start == 0:
+            return True
+        return client.last_track == track_id and abs(start - client.last_end) <= config.STREAM_HEAD_WINDOW_BYTES
+
+    def shape(self, body, client, track_id, start, priority):
+        """
+        Wrap a response body so it is sent within the client and global budgets.
+
+        The stream slot is released when the wrapper is closed, which the
+        WSGI server does for every response, including HEAD requests and
+        clients that disconnect before the first chunk.
+
+        Args:
+            body: Iterable of bytes (the response's app_iter)
+            client: State returned by open_stream()
+            track_id: Track being streamed
+            start: First byte offset of the body within the file
+            priority: If True, the first config.STREAM_PRIORITY_BYTES are sent unshaped
+
+        Returns:
+            A ShapedBody to use as the response body
+        """
+        return ShapedBody(self, body, client, track_id, start, priority)
+
+    def _pace(self, client, n, sent, exempt):
+        wait = max(client.bucket.reserve(n), self._global_bucket().reserve(n))
+
+        throttled = sent >= exempt and wait > 0
+        with self._stats_lock:
+            self.shaped_bytes += n
+            if sent < exempt:
+                self.priority_bytes += n
+            elif throttled:
+                self.throttled_bytes += n
+                self.throttle_wait_seconds += wait
+        if throttled:
+            time.sleep(wait)
+
+    def stats(self):
+        """
+        Get shaping counters.
+
+        Returns:
+            Dictionary with throttled/priority byte counts and stream counts
+        """
+        with self._lock:
+            active = sum(c.active for c in self._clients.values())
+            clients = len(self._clients)
+            rejected = self.rejected_streams
+        with self._stats_lock:
+            return {
+                'enabled': self.enabled(),
+                'clients': clients,
+                'active_streams': active,
+                'rejected_streams': rejected,
+                'bytes_sent': self.shaped_bytes,
+                'throttled_bytes': self.throttled_bytes,
+                'throttle_wait_seconds': round(self.throttle_wait_seconds, 3),
+                'priority_bytes': self.priority_bytes,
+            }
+
+
+class ShapedBody:
+    """
+    Paced response body that owns a stream slot until it is closed.
+    """
+
+    def __init__(self, shaper, body, client, track_id, start, priority):
+        self._shaper = shaper
+        self._body = body
+        self._client = client
+        self._track_id = track_id
+        self._start = start
+        self._exempt = config.STREAM_PRIORITY_BYTES if priority else 0
+        self._released = False
+
+    def __iter__(self):
+        client = self._client
+        sent = 0
+        for chunk in self._body:
+            n = len(chunk)
+            self._shaper._pace(client, n, sent, self._exempt)
+            sent += n
+            client.last_track = self._track_id
+            client.last_end = self._start + sent
+            yield chunk
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._shaper.close_stream(self._client)
+        if hasattr(self._body, 'close'):
+            self._body.close()
+
+
+stream_shaper = StreamShaper()
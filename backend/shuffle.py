@@ -0,0 +1,230 @@
+"""
+Weighted shuffle for Yurt Radio.
+
+Picks tracks with probability proportional to a weight that favours
+under-played tracks and penalises recently played ones. Sampling uses a
+Vose alias table, so each pick is O(1) regardless of library size.
+
+The alias table is rebuilt periodically from the database. Between rebuilds,
+plays are applied to in-memory counters and picks are corrected by rejection
+sampling: a candidate drawn with its build-time weight is accepted with
+probability current_weight / build_weight. Plays only ever lower a track's
+weight, so the corrected distribution stays exact until the next rebuild;
+tracks recovering from the recency penalty catch up when the table is rebuilt.
+"""
+
+from array import array
+from bisect import bisect_left
+import random
+import threading
+import time
+from backend.models import get_db
+import config
+
+
+class AliasTable:
+    """
+    Vose alias table over a list of non-negative weights.
+    """
+
+    def __init__(self, weights):
+        n = len(weights)
+        self.n = n
+        self.prob = array('d', bytes(8 * n))
+        self.alias = array('l', bytes(array('l').itemsize * n))
+
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            return
+
+        scaled = array('d', (w * n / total for w in weights))
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            g = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] = (scaled[g] + scaled[s]) - 1.0
+            if scaled[g] < 1.0:
+                small.append(g)
+            else:
+                large.append(g)
+
+        # Leftovers are 1.0 up to floating point error.
+        for i in large:
+            self.prob[i] = 1.0
+        for i in small:
+            self.prob[i] = 1.0
+
+    def sample(self, rng=random):
+        """
+        Draw one index.
+
+        Args:
+            rng: Object with a random() method
+
+        Returns:
+            An index into the original weights list
+        """
+        u = rng.random() * self.n
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+
+def track_weight(play_count, last_played, now):
+    """
+    Compute a track's selection weight.
+
+    Args:
+        play_count: Number of times the track has been played
+        last_played: Unix timestamp of the last play, or 0 if never played
+        now: Current unix timestamp
+
+    Returns:
+        A positive float; higher means more likely to be picked
+    """
+    weight = 1.0 / (1 + play_count)
+    if last_played:
+        window = config.WEIGHTED_SHUFFLE_RECENCY_HOURS * 3600
+        recency = (now - last_played) / window
+        weight *= min(1.0, max(config.WEIGHTED_SHUFFLE_RECENCY_FLOOR, recency))
+    return weight
+
+
+class WeightedSampler:
+    """
+    Alias-table sampler over the whole tracks table.
+
+    The first pick builds the table synchronously; later rebuilds happen in
+    a background thread while the old table keeps serving.
+    """
+
+    # Give up on rejection sampling after this many draws and take the last candidate.
+    MAX_DRAWS = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._rebuilding = False
+        self._stale = False
+
+    def invalidate(self):
+        """
+        Mark the table for rebuild, e.g. after tracks were added or removed.
+        """
+        self._stale = True
+
+    def _load(self):
+        now = int(time.time())
+        ids = array('q')
+        play_counts = array('l')
+        last_played = array('q')
+
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, play_count, CAST(strftime('%s', last_played) AS INTEGER)
+                FROM tracks ORDER BY id
+            """)
+            for track_id, play_count, played_at in cursor:
+                ids.append(track_id)
+                play_counts.append(play_count or 0)
+                last_played.append(played_at or 0)
+
+        weights = array('d', (track_weight(play_counts[i], last_played[i], now) for i in range(len(ids))))
+        return _SamplerState(ids, play_counts, last_played, weights, AliasTable(weights), now)
+
+    def rebuild(self):
+        """
+        Reload weights from the database and swap in a fresh alias table.
+        """
+        self._stale = False
+        state = self._load()
+        with self._lock:
+            self._state = state
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        finally:
+            self._rebuilding = False
+
+    def _current(self):
+        state = self._state
+        if state is None:
+            with self._lock:
+                if self._state is None:
+                    self._stale = False
+                    self._state = self._load()
+                return self._state
+
+        age = time.time() - state.built_at
+        if (self._stale or age > config.WEIGHTED_SHUFFLE_REBUILD_SECONDS) and not self._rebuilding:
+            self._rebuilding = True
+            self._stale = False
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+        return state
+
+    def pick(self, exclude_ids=None):
+        """
+        Pick a track ID.
+
+        Args:
+            exclude_ids: Track IDs that must not be returned; any container
+                supporting `in`, such as a list or a session history filter
+
+        Returns:
+            A track ID, or None if the library is empty or fully excluded
+        """
+        state = self._current()
+        if not state.ids:
+            return None
+
+        exclude = exclude_ids if exclude_ids is not None else ()
+        now = time.time()
+        candidate = None
+
+        for _ in range(self.MAX_DRAWS):
+            i = state.table.sample()
+            track_id = state.ids[i]
+            if track_id in exclude:
+                continue
+            candidate = track_id
+            current = track_weight(state.play_counts[i], state.last_played[i], now)
+            if random.random() * state.weights[i] < current:
+                return track_id
+
+        return candidate
+
+    def record_play(self, track_id):
+        """
+        Apply a play to the in-memory counters so the next pick sees it.
+
+        Args:
+            track_id: The ID of the track that was played
+        """
+        state = self._state
+        if state is None:
+            return
+
+        i = bisect_left(state.ids, track_id)
+        if i < len(state.ids) and state.ids[i] == track_id:
+            state.play_counts[i] += 1
+            state.last_played[i] = int(time.time())
+
+
+class _SamplerState:
+    __slots__ = ('ids', 'play_counts', 'last_played', 'weights', 'table', 'built_at')
+
+    def __init__(self, ids, play_counts, last_played, weights, table, built_at):
+        self.ids = ids
+        self.play_counts = play_counts
+        self.last_played = last_played
+        self.weights = weights
+        self.table = table
+        self.built_at = built_at
+
+
+weighted_sampler = WeightedSampler()
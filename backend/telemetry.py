@@ -0,0 +1,238 @@
+"""
+Client playback telemetry for Yurt Radio.
+
+The radio page batches what listeners experience (time to first audio,
+buffering stalls, failed loads) and posts it to /api/telemetry. Events are
+folded into small in-memory histograms keyed by hour, track and metric, and
+a background thread merges those into the telemetry_rollups table every
+config.TELEMETRY_FLUSH_SECONDS, so ingesting a beacon never waits on SQLite.
+"""
+
+from bisect import bisect_left
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from backend.models import TELEMETRY_METRICS, TELEMETRY_BINS_MS, TELEMETRY_BIN_COLUMNS
+from backend.models import add_telemetry, bucket_start
+from backend.utils import is_valid_track_id
+import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Histogram:
+    __slots__ = ('count', 'total_ms', 'max_ms', 'bins')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0
+        self.max_ms = 0
+        self.bins = [0] * len(TELEMETRY_BIN_COLUMNS)
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.bins[bisect_left(TELEMETRY_BINS_MS, ms)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.bins = [a + b for a, b in zip(self.bins, other.bins)]
+
+
+def histogram_percentile(bins, q):
+    """
+    Estimate a percentile from histogram bin counts.
+
+    Args:
+        bins: Counts per TELEMETRY_BIN_COLUMNS entry
+        q: Percentile as a fraction, e.g. 0.95
+
+    Returns:
+        Upper bound (ms) of the bin holding the percentile, None if it lands
+        in the overflow bin or the histogram is empty
+    """
+    total = sum(bins)
+    if not total:
+        return None
+
+    seen = 0
+    for bound, count in zip(TELEMETRY_BINS_MS, bins):
+        seen += count
+        if seen >= q * total:
+            return bound
+    return None
+
+
+def _row(key, histogram):
+    metric, bucket, track_id = key
+    return (metric, bucket, track_id, histogram.count, histogram.total_ms, histogram.max_ms, *histogram.bins)
+
+
+class TelemetryAggregator:
+    """
+    In-memory histograms with a periodic background flush to SQLite.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flusher = None
+        self.events = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.bad_rows = 0
+
+    @staticmethod
+    def enabled():
+        return config.TELEMETRY_ENABLED
+
+    @staticmethod
+    def parse_event(event):
+        """
+        Validate one beacon event.
+
+        Args:
+            event: Dictionary with "type", "track_id" and (except for errors) "ms"
+
+        Returns:
+            (metric, track_id, ms) tuple, or None if the event is malformed
+        """
+        if not isinstance(event, dict):
+            return None
+
+        metric = event.get('type')
+        track_id = event.get('track_id')
+        ms = event.get('ms', 0)
+        if metric not in TELEMETRY_METRICS or not is_valid_track_id(track_id):
+            return None
+        if isinstance(ms, bool) or not isinstance(ms, (int, float)) or not 0 <= ms <= config.TELEMETRY_MAX_MS:
+            return None
+        return metric, track_id, int(ms)
+
+    def record(self, events):
+        """
+        Add parsed events to the current histograms.
+
+        Args:
+            events: List of (metric, track_id, ms) tuples from parse_event()
+
+        Returns:
+            Number of events kept (the rest are dropped if too many distinct
+            track/metric pairs are waiting for a flush)
+        """
+        bucket = bucket_start('hour', int(time.time()))
+        kept = 0
+
+        with self._lock:
+            for metric, track_id, ms in events:
+                key = (metric, bucket, track_id)
+                histogram = self._pending.get(key)
+                if histogram is None:
+                    if len(self._pending) >= config.TELEMETRY_MAX_PENDING:
+                        continue
+                    histogram = self._pending[key] = _Histogram()
+                histogram.add(ms)
+                kept += 1
+
+            self.events += kept
+            self.dropped += len(events) - kept
+
+        self._ensure_flusher()
+        return kept
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(config.TELEMETRY_FLUSH_SECONDS)
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending histograms to the database.
+
+        If the batch fails, histograms are written one at a time so a row the
+        database rejects is dropped instead of blocking every later flush.
+        Histograms that fail because the database is busy or unavailable are
+        merged back so the next flush retries them.
+
+        Returns:
+            Number of rows written
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            add_telemetry([_row(key, h) for key, h in pending.items()])
+        except Exception:
+            logger.exception("Telemetry flush failed; retrying %d histograms one at a time", len(pending))
+            with self._lock:
+                self.flush_errors += 1
+            return self._flush_each(pending)
+
+        with self._lock:
+            self.flushes += 1
+        return len(pending)
+
+    def _flush_each(self, pending):
+        items = list(pending.items())
+        written = 0
+        for i, (key, histogram) in enumerate(items):
+            try:
+                add_telemetry([_row(key, histogram)])
+                written += 1
+            except sqlite3.OperationalError:
+                # Busy or unavailable: keep this and the rest for the next flush
+                self._merge_back(items[i:])
+                break
+            except Exception:
+                logger.exception("Dropping telemetry histogram %r", key)
+                with self._lock:
+                    self.bad_rows += 1
+        return written
+
+    def _merge_back(self, items):
+        with self._lock:
+            for key, histogram in items:
+                current = self._pending.get(key)
+                if current is None:
+                    self._pending[key] = histogram
+                else:
+                    current.merge(histogram)
+
+    def stats(self):
+        """
+        Get telemetry counters.
+
+        Returns:
+            Dictionary with event, drop and flush counts
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled(),
+                'events': self.events,
+                'dropped': self.dropped,
+                'pending_histograms': len(self._pending),
+                'flushes': self.flushes,
+                'flush_errors': self.flush_errors,
+                'bad_rows': self.bad_rows,
+            }
+
+
+telemetry = TelemetryAggregator()
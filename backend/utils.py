@@ -47,6 +47,20 @@ def extract_metadata(file_path):
     return metadata
 
 
+def resolve_track_path(track):
+    """
+    Get the full path to a track's audio file.
+
+    Args:
+        track: Track row with 'file_path' and 'music_root'
+
+    Returns:
+        String: file_path joined onto the track's music root; tracks
+        scanned before multiple roots were supported use config.MUSIC_DIRECTORY
+    """
+    return os.path.join(track['music_root'] or config.MUSIC_DIRECTORY, track['file_path'])
+
+
 def is_supported_format(file_path):
     """
     Check if a file is a supported audio format.
@@ -92,6 +106,40 @@ def get_mimetype(file_path):
     return 'audio/mpeg'  # default
 
 
+# Largest value SQLite can store in an INTEGER column (and so the largest track ID)
+MAX_TRACK_ID = 2 ** 63 - 1
+
+
+def is_valid_track_id(value):
+    """
+    Check that a client-supplied value can be a track ID.
+
+    Args:
+        value: Value decoded from a request body
+
+    Returns:
+        Boolean: True for ints from 1 to MAX_TRACK_ID (bools are rejected)
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= MAX_TRACK_ID
+
+
+def file_etag(size, mtime_ns):
+    """
+    Get the ETag for an audio file's current contents.
+
+    Used for both disk and cached responses, so If-Range and If-None-Match
+    keep matching when a file moves in or out of the stream cache.
+
+    Args:
+        size: File size in bytes
+        mtime_ns: File modification time in nanoseconds
+
+    Returns:
+        String: ETag value (unquoted)
+    """
+    return f"{mtime_ns:x}-{size:x}"
+
+
 def format_duration(seconds):
     """
     Format duration in seconds to MM:SS or HH:MM:SS format.
@@ -6,10 +6,15 @@ You can use environment variables or hardcode values for now.
 """
 
 import os
+import secrets
 
 # Example: MUSIC_DIRECTORY = 'E:\\yurt-radio\\music'
 MUSIC_DIRECTORY = os.getenv('MUSIC_DIR', './music')
 
+# All music directories, separated by os.pathsep (':' on Linux/macOS, ';' on Windows).
+# Directories on different disks are scanned in parallel.
+MUSIC_DIRECTORIES = [d for d in os.getenv('MUSIC_DIRS', MUSIC_DIRECTORY).split(os.pathsep) if d]
+
 # This will be created automatically when you run the app
 DATABASE_PATH = os.getenv('DB_PATH', './data/yurt_radio.db')
 
@@ -19,6 +24,115 @@ SUPPORTED_FORMATS = ['.mp3', '.flac', '.ogg', '.m4a', '.wav']
 # Higher number = less repetition, but requires more memory
 MAX_RECENT_TRACKS = 10
 
+# Per-listener no-repeat history, keyed by a session cookie (on by default).
+# Without a cookie, the shared MAX_RECENT_TRACKS list is used instead.
+SESSION_HISTORY_ENABLED = os.getenv('SESSION_HISTORY', 'true').lower() in ('1', 'true', 'yes')
+
+# Each listener avoids at least this many of their most recent tracks
+SESSION_HISTORY_TRACKS = 500
+
+# Rotating Bloom filter generations; more means less memory slack but slower lookups
+SESSION_HISTORY_GENERATIONS = 4
+
+# Chance a not-recently-played track is wrongly treated as recent
+SESSION_HISTORY_FALSE_POSITIVE = 0.02
+
+# Sessions remembered at once (least recently active are dropped). About 1.2 KB
+# each with the settings above, bookkeeping included, so 100k sessions is ~120 MB.
+SESSION_HISTORY_MAX_SESSIONS = 100000
+
+# Session cookie name and lifetime in seconds
+SESSION_COOKIE_NAME = 'yr_session'
+SESSION_COOKIE_MAX_AGE = 30 * 86400
+
+# Key for signing session cookies. Set it when running several workers, or
+# every restart and every other worker will treat existing cookies as new.
+SESSION_SECRET = os.getenv('SESSION_SECRET') or secrets.token_hex(32)
+
+# Largest batch accepted by POST /api/ratings
+MAX_RATINGS_PER_BATCH = 500
+
+# Weighted shuffle: favour under-played tracks, penalise recently played ones
+WEIGHTED_SHUFFLE_ENABLED = os.getenv('WEIGHTED_SHUFFLE', 'false').lower() in ('1', 'true', 'yes')
+
+# A track's recency penalty fades out linearly over this many hours
+WEIGHTED_SHUFFLE_RECENCY_HOURS = 24
+
+# Smallest recency multiplier, so just-played tracks are rare but not impossible
+WEIGHTED_SHUFFLE_RECENCY_FLOOR = 0.01
+
+# Rebuild the alias table from the database at most this often (seconds)
+WEIGHTED_SHUFFLE_REBUILD_SECONDS = 300
+
+# Serve read-only track endpoints from an in-memory catalog snapshot (off by default)
+CATALOG_ENABLED = os.getenv('CATALOG', 'false').lower() in ('1', 'true', 'yes')
+
+# How often (seconds) to check whether the scanner changed the catalog generation
+CATALOG_REFRESH_SECONDS = 2
+
+# In-memory cache of popular audio files for /api/stream (off by default)
+STREAM_CACHE_ENABLED = os.getenv('STREAM_CACHE', 'false').lower() in ('1', 'true', 'yes')
+
+# Total memory budget for cached audio, in bytes
+STREAM_CACHE_MAX_BYTES = int(os.getenv('STREAM_CACHE_MB', '256')) * 1024 * 1024
+
+# Files larger than this are always streamed from disk
+STREAM_CACHE_MAX_FILE_BYTES = 64 * 1024 * 1024
+
+# A file is cached once it has been requested this many times
+STREAM_CACHE_ADMIT_AFTER = 2
+
+# Cached files are stored and served in chunks of this size
+STREAM_CACHE_CHUNK_BYTES = 64 * 1024
+
+# Bandwidth shaping for /api/stream (off by default). Clients are keyed by
+# remote address, so put werkzeug's ProxyFix in front when behind a proxy.
+STREAM_SHAPING_ENABLED = os.getenv('STREAM_SHAPING', 'false').lower() in ('1', 'true', 'yes')
+
+# Sustained and burst budget per client, in bytes (256 KiB/s is ~8x a 256 kbps stream)
+STREAM_CLIENT_RATE = int(os.getenv('STREAM_CLIENT_KBPS', '256')) * 1024
+STREAM_CLIENT_BURST = 1024 * 1024
+
+# Sustained and burst budget for the whole server, in bytes (~100 Mbit/s uplink)
+STREAM_GLOBAL_RATE = int(os.getenv('STREAM_GLOBAL_KBPS', '12288')) * 1024
+STREAM_GLOBAL_BURST = 4 * 1024 * 1024
+
+# Concurrent streams allowed per client before answering 429
+STREAM_MAX_PER_CLIENT = 4
+
+# Bytes sent unshaped at the start of a playback request, for fast time-to-first-audio
+STREAM_PRIORITY_BYTES = 256 * 1024
+
+# A range starting within this many bytes of the client's last range counts as playback
+STREAM_HEAD_WINDOW_BYTES = 1024 * 1024
+
+# Number of idle clients whose buckets are remembered
+STREAM_SHAPING_MAX_CLIENTS = 10000
+
+# Segmented MP3 delivery via /api/stream/<id>/playlist.m3u8 (off by default)
+SEGMENTS_ENABLED = os.getenv('SEGMENTS', 'false').lower() in ('1', 'true', 'yes')
+
+# Target segment duration in seconds; segments are cut at the next MP3 frame boundary
+SEGMENT_SECONDS = 6
+
+# How often (seconds) new play events are folded into the /api/stats/history rollups
+PLAY_ROLLUP_SECONDS = 60
+
+# Client playback telemetry via POST /api/telemetry (on by default)
+TELEMETRY_ENABLED = os.getenv('TELEMETRY', 'true').lower() in ('1', 'true', 'yes')
+
+# How often (seconds) in-memory telemetry histograms are written to the database
+TELEMETRY_FLUSH_SECONDS = 30
+
+# Largest batch accepted by POST /api/telemetry
+TELEMETRY_MAX_EVENTS = 100
+
+# Events with a larger duration (ms) are rejected as bogus
+TELEMETRY_MAX_MS = 10 * 60 * 1000
+
+# Distinct (hour, track, metric) histograms held between flushes; events beyond this are dropped
+TELEMETRY_MAX_PENDING = 50000
+
 # Images directory
 IMAGES_DIRECTORY = os.getenv('IMAGES_DIR', './images')
 
@@ -1,7 +1,7 @@
 """
 Music Scanner Script for Yurt Radio.
 
-This script scans the music directory and populates the database
+This script scans the music directories and populates the database
 with track metadata.
 
 Usage: python scripts/scan_music.py
@@ -9,50 +9,153 @@ Usage: python scripts/scan_music.py
 
 import os
 import sys
+import argparse
+import gzip
 import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Add parent directory to path so we can import from backend
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.models import insert_track, insert_or_update_track, init_db, del_by_unseen_hash
+from backend.models import insert_track, upsert_tracks, init_db, del_by_unseen_hash, get_file_fingerprints
+from backend.models import bump_catalog_generation, iter_manifest_rows, import_manifest_rows, MANIFEST_COLUMNS
+from backend.cache import stream_cache
+from backend.segments import index_file, is_segmentable
+from backend.models import save_track_segments
+from backend.shuffle import weighted_sampler
 from backend.utils import extract_metadata, is_supported_format
 import config
 
 def hash_file(path):
     h = hashlib.sha1()
     with open(path, 'rb') as f:
-        while chunk := f.read(8192):
+        while chunk := f.read(1024 * 1024):
             h.update(chunk)
     return h.hexdigest()
 
+def group_roots_by_device(roots):
+    """
+    Group music roots by the physical device they live on.
+
+    Args:
+        roots: List of music directory paths
+
+    Returns:
+        List of lists of roots, one list per device (st_dev)
+    """
+    groups = {}
+    for root in roots:
+        groups.setdefault(os.stat(root).st_dev, []).append(root)
+    return list(groups.values())
+
+
+def scan_root(root, known=None):
+    """
+    Read metadata and hash every supported file in one music root.
+
+    Files whose size and mtime match the stored fingerprint in `known` are
+    not opened; their stored hash and metadata are reused. When segmented
+    delivery is enabled, new or changed MP3s also get their segment index
+    stored.
+
+    Args:
+        root: Music directory path
+        known: Optional result of get_file_fingerprints()
+
+    Returns:
+        (files_seen, tracks) where tracks is a list of (file_path, file_hash, title,
+        author, duration, file_size, music_root, file_mtime_ns) tuples
+    """
+    known = known or {}
+    tracks = []
+    segments = []
+
+    files = os.listdir(root)
+    for filename in files:
+        if os.path.splitext(filename)[1] in config.SUPPORTED_FORMATS:
+            path = os.path.join(root, filename)
+            st = os.stat(path)
+
+            previous = known.get((root, filename))
+            if previous and previous[5] == st.st_size and previous[7] == st.st_mtime_ns:
+                tracks.append(previous)
+                continue
+
+            metadata = extract_metadata(path)
+            filehash = hash_file(path)
+            tracks.append((filename, filehash, metadata['title'], metadata['author'],
+                           metadata['duration'], metadata['file_size'], root, st.st_mtime_ns))
+
+            if config.SEGMENTS_ENABLED and is_segmentable(filename):
+                row = index_file(path, filehash)
+                if row is not None:
+                    segments.append(row)
+
+    if segments:
+        save_track_segments(segments)
+    return len(files), tracks
+
+
+def scan_roots(roots, known=None):
+    """
+    Scan music roots with one worker thread per physical device.
+
+    Roots on the same disk are scanned one after another by the same worker
+    so their reads don't seek against each other; separate disks run in
+    parallel (file reads and hashing release the GIL).
+
+    Args:
+        roots: List of music directory paths
+        known: Optional result of get_file_fingerprints(), see scan_root()
+
+    Yields:
+        (root, files_seen, tracks) for each root, see scan_root()
+    """
+    groups = group_roots_by_device(roots)
+    if not groups:
+        return
+
+    def scan_group(group):
+        return [(root, *scan_root(root, known)) for root in group]
+
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        for results in pool.map(scan_group, groups):
+            yield from results
+
+
+def _print_header():
+    print(f"Scanning music directories: {', '.join(config.MUSIC_DIRECTORIES)}")
+    print(f"Supported formats: {', '.join(config.SUPPORTED_FORMATS)}")
+    print("-" * 50)
+
+
 def scan_music_directory():
     """
-    Scan the music directory and populate the database.
+    Scan the music directories and populate the database.
 
     This function:
-    1. Walks through the music directory recursively
+    1. Lists every configured music directory, one worker per disk
     2. Finds all supported audio files
     3. Extracts metadata from each file
     4. Inserts the track into the database
     """
 
     init_db()
-    print(f"Scanning music directory: {config.MUSIC_DIRECTORY}")
-    print(f"Supported formats: {', '.join(config.SUPPORTED_FORMATS)}")
-    print("-" * 50)
+    _print_header()
 
     total_scanned = 0
     total_added = 0
 
-    files = os.listdir(config.MUSIC_DIRECTORY)
-    for filename in files:
-        total_scanned += 1
-        if os.path.splitext(filename)[1] in config.SUPPORTED_FORMATS:
-            metadata = extract_metadata(f"{config.MUSIC_DIRECTORY}/{filename}")
-            filehash = hash_file(f"{config.MUSIC_DIRECTORY}/{filename}")
-            insert_track(filename, filehash, metadata['title'], metadata['author'], metadata['duration'], metadata['file_size'])
+    for root, files_seen, tracks in scan_roots(config.MUSIC_DIRECTORIES):
+        total_scanned += files_seen
+        for track in tracks:
+            insert_track(*track)
             total_added += 1
 
+    bump_catalog_generation()
+
     print("-" * 50)
     print("Scan complete!")
     print(f"Files scanned: {total_scanned}")
@@ -61,50 +164,172 @@ def scan_music_directory():
 
 def rescan_music_directory():
     """
-    Rescan the music directory and update the database.
+    Rescan the music directories and update the database.
 
     This is similar to scan_music_directory() but can be used to
     update metadata for existing tracks or add new ones.
     """
-    print(f"Scanning music directory: {config.MUSIC_DIRECTORY}")
-    print(f"Supported formats: {', '.join(config.SUPPORTED_FORMATS)}")
-    print("-" * 50)
+    init_db()
+    _print_header()
 
     total_scanned = 0
     total_added = 0
 
     seen_hashes = set()
+    known = get_file_fingerprints()
+    total_changed = 0
 
-    files = os.listdir(config.MUSIC_DIRECTORY)
-    for filename in files:
-        total_scanned += 1
-        if os.path.splitext(filename)[1] in config.SUPPORTED_FORMATS:
-            metadata = extract_metadata(f"{config.MUSIC_DIRECTORY}/{filename}")
-            filehash = hash_file(f"{config.MUSIC_DIRECTORY}/{filename}")
+    for root, files_seen, tracks in scan_roots(config.MUSIC_DIRECTORIES, known):
+        changed = [track for track in tracks if known.get((root, track[0])) != track]
+        print(f"{root}: {len(tracks)} tracks ({len(changed)} new or changed)")
+        total_scanned += files_seen
+        total_added += len(tracks)
+        total_changed += len(changed)
+        upsert_tracks(changed)
+
+        for filename, filehash, *_ in tracks:
             seen_hashes.add(filehash)
-            insert_or_update_track(filename, filehash, metadata['title'], metadata['author'], metadata['duration'], metadata['file_size'])
-            total_added += 1
+
+            # Contents changed under the same name: drop any cached bytes
+            previous = known.pop((root, filename), None)
+            if previous and previous[1] != filehash:
+                stream_cache.invalidate(os.path.join(root, filename))
+
+    # Files that disappeared
+    for root, filename in known:
+        stream_cache.invalidate(os.path.join(root or config.MUSIC_DIRECTORY, filename))
 
     total_removed = del_by_unseen_hash(seen_hashes)
+    # An unchanged rescan must not make every server reload its catalog
+    if total_changed or total_removed:
+        bump_catalog_generation()
+        weighted_sampler.invalidate()
 
     print("-" * 50)
     print("Scan complete!")
     print(f"Files scanned: {total_scanned}")
     print(f"Tracks added to database: {total_added}")
+    print(f"Tracks new or changed: {total_changed}")
     print(f"Tracks removed: {total_removed}")
 
 
+MANIFEST_FORMAT = 'yurt-radio-manifest'
+MANIFEST_VERSION = 1
+
+
+def export_manifest(path):
+    """
+    Write the tracks table to a gzip-compressed JSON Lines manifest.
+
+    The first line is a header with the format name and version; every
+    following line is one track (see MANIFEST_COLUMNS), including the
+    size/mtime fingerprint used to skip re-hashing on import.
+
+    Args:
+        path: Destination file, conventionally *.jsonl.gz
+
+    Returns:
+        Number of tracks written
+    """
+    init_db()
+    count = 0
+
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        header = {
+            'format': MANIFEST_FORMAT,
+            'version': MANIFEST_VERSION,
+            'created_at': int(time.time()),
+            'columns': list(MANIFEST_COLUMNS),
+            'music_roots': config.MUSIC_DIRECTORIES,
+        }
+        f.write(json.dumps(header) + '\n')
+
+        for row in iter_manifest_rows():
+            f.write(json.dumps(row, separators=(',', ':')) + '\n')
+            count += 1
+
+    print(f"Exported {count} tracks to {path}")
+    return count
+
+
+def _read_manifest(f):
+    header = json.loads(f.readline() or '{}')
+    if header.get('format') != MANIFEST_FORMAT:
+        raise ValueError("Not a Yurt Radio manifest")
+    if header.get('version', 0) > MANIFEST_VERSION:
+        raise ValueError(f"Manifest version {header['version']} is newer than supported ({MANIFEST_VERSION})")
+
+    missing_roots = set(header.get('music_roots', [])) - set(config.MUSIC_DIRECTORIES)
+    if missing_roots:
+        print(f"Warning: manifest roots not configured here: {', '.join(sorted(missing_roots))}")
+
+    for line in f:
+        if line.strip():
+            row = json.loads(line)
+            yield {column: row.get(column) for column in MANIFEST_COLUMNS}
+
+
+def import_manifest(path, verify=True):
+    """
+    Bulk load a manifest written by export_manifest(), then optionally verify.
+
+    The import runs in a single transaction. Verification is a normal rescan:
+    files whose size/mtime match the manifest are not re-read, so only
+    files that actually differ on this node get hashed.
+
+    Args:
+        path: Manifest file
+        verify: Rescan the music directories after importing
+
+    Returns:
+        Number of tracks inserted or changed
+    """
+    init_db()
+
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        count = import_manifest_rows(_read_manifest(f))
+
+    if count:
+        bump_catalog_generation()
+        weighted_sampler.invalidate()
+    print(f"Imported {count} new or changed tracks from {path}")
+
+    if verify:
+        rescan_music_directory()
+    return count
+
+
 if __name__ == '__main__':
     """
     Main entry point for the script.
 
-    TODO: Add command line argument parsing (optional)
-    For now, just call scan_music_directory()
+    Usage:
+        python scripts/scan_music.py [scan]
+        python scripts/scan_music.py export-manifest catalog.jsonl.gz
+        python scripts/scan_music.py import-manifest catalog.jsonl.gz [--no-verify]
     """
-    # Check if music directory exists
-    if not os.path.exists(config.MUSIC_DIRECTORY):
-        print(f"Error: Music directory not found: {config.MUSIC_DIRECTORY}")
-        print("Please create the directory and add some music files.")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Scan music and manage the Yurt Radio catalog.')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('scan', help='Rescan the music directories (default)')
+    export_parser = commands.add_parser('export-manifest', help='Export the catalog to a manifest file')
+    export_parser.add_argument('path')
+    import_parser = commands.add_parser('import-manifest', help='Bulk import a manifest file')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--no-verify', action='store_true', help='Skip the rescan after importing')
+    args = parser.parse_args()
+
+    if args.command == 'export-manifest':
+        export_manifest(args.path)
+        sys.exit(0)
+
+    # Check if the music directories exist
+    for directory in config.MUSIC_DIRECTORIES:
+        if not os.path.exists(directory):
+            print(f"Error: Music directory not found: {directory}")
+            print("Please create the directory and add some music files.")
+            sys.exit(1)
 
-    rescan_music_directory()
+    if args.command == 'import-manifest':
+        import_manifest(args.path, verify=not args.no_verify)
+    else:
+        rescan_music_directory()
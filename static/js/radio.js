@@ -18,6 +18,13 @@ const API_BASE_URL = '/api';
 let currentTrack = null;
 let isPlaying = false;
 
+// Playback telemetry, batched and sent to /api/telemetry
+const TELEMETRY_FLUSH_MS = 30000;
+const TELEMETRY_MAX_BATCH = 20;
+let telemetryQueue = [];
+let loadStartedAt = null;   // set when a track's src is assigned, cleared on first audio
+let stallStartedAt = null;  // set on 'waiting' after playback has started
+
 // ==================== DOM ELEMENTS ====================
 
 const audioPlayer = document.getElementById('audio-player');
@@ -91,6 +98,33 @@ async function fetchStats() {
     }
 }
 
+/**
+ * Queue a playback telemetry event, sending the batch once it is full
+ */
+function recordTelemetry(type, ms = 0) {
+    if (!currentTrack) return;
+
+    telemetryQueue.push({ type, track_id: currentTrack.id, ms: Math.round(ms) });
+    if (telemetryQueue.length >= TELEMETRY_MAX_BATCH) {
+        flushTelemetry();
+    }
+}
+
+/**
+ * Send queued telemetry events as a beacon
+ */
+function flushTelemetry() {
+    if (telemetryQueue.length === 0) return;
+
+    const body = JSON.stringify({ events: telemetryQueue });
+    telemetryQueue = [];
+
+    // sendBeacon survives page unloads; fall back to a keepalive fetch
+    if (!(navigator.sendBeacon && navigator.sendBeacon(`${API_BASE_URL}/telemetry`, body))) {
+        fetch(`${API_BASE_URL}/telemetry`, { method: 'POST', body, keepalive: true }).catch(() => {});
+    }
+}
+
 // ==================== PLAYER FUNCTIONS ====================
 
 /**
@@ -106,6 +140,8 @@ async function loadTrack(track, autoplay = false) {
     currentTrack = track;
     // Set audio source
     audioPlayer.src = `${API_BASE_URL}/stream/${track.id}`;
+    loadStartedAt = performance.now();
+    stallStartedAt = null;
     // Update UI
     updateUI(currentTrack);
     // Optionally play
@@ -290,9 +326,31 @@ function setupEventListeners() {
 
     audioPlayer.addEventListener('timeupdate', updateProgress);
 
+    // Telemetry: time to first audio and buffering stalls
+    audioPlayer.addEventListener('playing', () => {
+        const now = performance.now();
+        if (loadStartedAt !== null) {
+            recordTelemetry('ttfa', now - loadStartedAt);
+            loadStartedAt = null;
+        } else if (stallStartedAt !== null) {
+            recordTelemetry('stall', now - stallStartedAt);
+        }
+        stallStartedAt = null;
+    });
+
+    audioPlayer.addEventListener('waiting', () => {
+        // Seeks also fire 'waiting'; only count buffering during normal playback
+        if (loadStartedAt === null && stallStartedAt === null && !audioPlayer.seeking) {
+            stallStartedAt = performance.now();
+        }
+    });
+
     audioPlayer.addEventListener('error', (e) => {
         console.error('Audio error:', e);
         showStatus('Error playing track', 'error');
+        recordTelemetry('error');
+        loadStartedAt = null;
+        stallStartedAt = null;
     });
 
     // Progress bar click to seek
@@ -338,6 +396,13 @@ function init() {
     // Set up event listeners
     setupEventListeners();
 
+    // Send telemetry periodically and when the page is hidden or closed
+    setInterval(flushTelemetry, TELEMETRY_FLUSH_MS);
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden') flushTelemetry();
+    });
+    window.addEventListener('pagehide', flushTelemetry);
+
     console.log('Yurt Radio ready!');
 }
 
@@ -0,0 +1,398 @@
+"""
+Benchmark suite for Yurt Radio hot paths.
+
+Builds synthetic catalogs of increasing size in a scratch directory and times
+the queries and endpoints the radio hits on every listener request.
+Results are written as JSON so runs can be compared against a saved baseline.
+
+Usage:
+    python -m tests.bench
+    python -m tests.bench --sizes 1000,100000 --output bench.json
+    python -m tests.bench --baseline bench_baseline.json --fail-on-regression
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import models
+from backend.cache import stream_cache
+from backend.catalog import catalog
+from backend.rollups import play_rollups
+from backend.services import TrackService, RatingService
+from backend.shuffle import weighted_sampler
+from tests import synthetic
+
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+STREAM_FILE_SECONDS = 300
+RANGE_BYTES = 256 * 1024
+
+
+def measure(fn, min_repeat=3, max_repeat=200, budget=1.0):
+    """
+    Time a callable repeatedly and summarise the samples.
+
+    Repeats until either max_repeat runs are done or the time budget is
+    spent, but always runs at least min_repeat times.
+
+    Args:
+        fn: Zero-argument callable to time
+        min_repeat: Minimum number of runs
+        max_repeat: Maximum number of runs
+        budget: Soft time budget in seconds
+
+    Returns:
+        Dictionary of timings in milliseconds plus the run count
+    """
+    samples = []
+    started = time.perf_counter()
+
+    while len(samples) < max_repeat:
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+        if len(samples) >= min_repeat and time.perf_counter() - started > budget:
+            break
+
+    samples.sort()
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0], 4),
+        'median_ms': round(statistics.median(samples), 4),
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+    }
+
+
+def _use_database(path):
+    if os.path.exists(path):
+        os.remove(path)
+    config.DATABASE_PATH = path
+    models.init_db()
+
+
+def _client():
+    # Imported lazily so app.py's init_db() runs against the scratch database.
+    import app
+    return app.app.test_client()
+
+
+def bench_catalog(size, workdir, rng):
+    """
+    Benchmark the read/write query paths against a catalog of `size` tracks.
+
+    Args:
+        size: Number of synthetic tracks
+        workdir: Scratch directory for the database and audio files
+        rng: Random generator used to choose track IDs and offsets
+
+    Returns:
+        Dictionary mapping benchmark name to timing summary
+    """
+    _use_database(os.path.join(workdir, f'bench_{size}.db'))
+
+    t0 = time.perf_counter()
+    synthetic.populate_tracks(size - 1, seed=size)
+    populate_seconds = time.perf_counter() - t0
+
+    # One real file so /api/stream has something to serve.
+    music_dir = os.path.join(workdir, 'stream')
+    os.makedirs(music_dir, exist_ok=True)
+    config.MUSIC_DIRECTORY = music_dir
+    config.MUSIC_DIRECTORIES = [music_dir]
+    stream_name = 'stream.mp3'
+    stream_size = synthetic.write_mp3(os.path.join(music_dir, stream_name), STREAM_FILE_SECONDS)
+    stream_id = models.insert_track(stream_name, synthetic.synthetic_hash(-1, size), 'stream', 'bench',
+                                    STREAM_FILE_SECONDS, stream_size)
+
+    pages = (size + 49) // 50
+    recent = [rng.randint(1, size) for _ in range(config.MAX_RECENT_TRACKS)]
+    client = _client()
+
+    def stream_range():
+        start = rng.randrange(0, stream_size - RANGE_BYTES)
+        rv = client.get(f'/api/stream/{stream_id}',
+                        headers={'Range': f'bytes={start}-{start + RANGE_BYTES - 1}'})
+        assert rv.status_code == 206, rv.status_code
+        rv.get_data()
+        rv.close()
+
+    results = {
+        'populate_rows_per_s': {'value': round((size - 1) / populate_seconds, 1)},
+        'get_random_track': measure(lambda: models.get_random_track(recent)),
+        'get_all_tracks_first_page': measure(lambda: models.get_all_tracks(1, 50)),
+        'get_all_tracks_middle_page': measure(lambda: models.get_all_tracks(max(1, pages // 2), 50)),
+        'get_all_tracks_last_page': measure(lambda: models.get_all_tracks(pages, 50)),
+        'get_track_by_id': measure(lambda: models.get_track_by_id(rng.randint(1, size))),
+        'get_stats': measure(models.get_stats),
+        'update_play_count': measure(lambda: models.update_play_count(rng.randint(1, size))),
+        'api_stream_range': measure(stream_range),
+    }
+
+    # update_play_count above appended play events; the history endpoint only
+    # reads rollups, so fold them in first as the background job would.
+    play_rollups.run_once()
+    results['api_stats_history'] = measure(lambda: client.get('/api/stats/history?period=week').close())
+
+    results.update(bench_shuffle())
+    results.update(bench_snapshot(size, pages, client, rng))
+    results['submit_rating_concurrent'] = bench_ratings(size, rng)
+
+    config.STREAM_CACHE_ENABLED = True
+    try:
+        # Only plays that start at byte 0 count toward admission; start two
+        # and wait for the background load so the timed ranges are hits.
+        for _ in range(config.STREAM_CACHE_ADMIT_AFTER):
+            client.get(f'/api/stream/{stream_id}', headers={'Range': f'bytes=0-{RANGE_BYTES - 1}'}).close()
+        deadline = time.time() + 30
+        while stream_cache.stats()['entries'] == 0:
+            assert time.time() < deadline, stream_cache.stats()
+            time.sleep(0.01)
+
+        hits = stream_cache.hits
+        results['api_stream_range_cached'] = measure(stream_range)
+        assert stream_cache.hits > hits, stream_cache.stats()
+    finally:
+        config.STREAM_CACHE_ENABLED = False
+        stream_cache.clear()
+
+    return results
+
+
+def bench_shuffle():
+    """
+    Compare uniform and weighted next-track selection on the current database.
+
+    Returns:
+        Dictionary with the alias table build time and per-pick timings
+    """
+    TrackService.clear_recent_tracks()
+    results = {'next_track_uniform': measure(TrackService.get_next_track)}
+
+    t0 = time.perf_counter()
+    weighted_sampler.rebuild()
+    results['weighted_table_build'] = {'seconds': round(time.perf_counter() - t0, 4)}
+
+    config.WEIGHTED_SHUFFLE_ENABLED = True
+    try:
+        results['next_track_weighted'] = measure(TrackService.get_next_track)
+    finally:
+        config.WEIGHTED_SHUFFLE_ENABLED = False
+        TrackService.clear_recent_tracks()
+
+    return results
+
+
+def bench_snapshot(size, pages, client, rng):
+    """
+    Time the read endpoints served from the in-memory catalog snapshot.
+
+    Returns:
+        Dictionary with load time, memory footprint and per-request timings
+    """
+    t0 = time.perf_counter()
+    catalog.load()
+    results = {'catalog_load': {'seconds': round(time.perf_counter() - t0, 4),
+                                'memory_bytes': catalog.stats()['memory_bytes']}}
+
+    def get(url):
+        client.get(url).close()
+
+    config.CATALOG_ENABLED = True
+    try:
+        results['api_track_by_id'] = measure(lambda: get(f'/api/track/{rng.randint(1, size)}'))
+        results['api_tracks_last_page'] = measure(lambda: get(f'/api/tracks?page={pages}'))
+        results['api_track_random'] = measure(lambda: get('/api/track/random'))
+    finally:
+        config.CATALOG_ENABLED = False
+        TrackService.clear_recent_tracks()
+
+    results['api_track_by_id_db'] = measure(lambda: get(f'/api/track/{rng.randint(1, size)}'))
+    results['api_tracks_last_page_db'] = measure(lambda: get(f'/api/tracks?page={pages}'))
+    return results
+
+
+def bench_ratings(size, rng, threads=32, per_thread=50):
+    """
+    Measure rating throughput with many concurrent submitters.
+
+    Returns:
+        Dictionary with ratings committed per second
+    """
+    picks = [[(rng.randint(1, size), rng.randint(1, 5)) for _ in range(per_thread)] for _ in range(threads)]
+
+    def submitter(pairs):
+        for track_id, rating in pairs:
+            RatingService.submit(track_id, rating)
+
+    workers = [threading.Thread(target=submitter, args=(pairs,)) for pairs in picks]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - t0
+
+    return {'seconds': round(elapsed, 4), 'value': round(threads * per_thread / elapsed, 1)}
+
+
+def bench_scanner(file_count, workdir):
+    """
+    Benchmark rescan_music_directory over a directory of synthetic files.
+
+    Runs a cold scan into an empty database, then a warm rescan where every
+    file is already known.
+
+    Args:
+        file_count: Number of audio files to generate
+        workdir: Scratch directory
+
+    Returns:
+        Dictionary of scan throughput figures
+    """
+    from scripts.scan_music import rescan_music_directory
+
+    music_dir = os.path.join(workdir, 'scan')
+    total_bytes = synthetic.write_library(music_dir, file_count)
+    config.MUSIC_DIRECTORY = music_dir
+    config.MUSIC_DIRECTORIES = [music_dir]
+    _use_database(os.path.join(workdir, 'bench_scan.db'))
+
+    results = {}
+    for label in ('cold', 'warm'):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rescan_music_directory()
+        elapsed = time.perf_counter() - t0
+        results[f'rescan_{label}'] = {
+            'seconds': round(elapsed, 4),
+            'files_per_s': round(file_count / elapsed, 1),
+            'mb_per_s': round(total_bytes / elapsed / 1e6, 2),
+        }
+
+    return results
+
+
+def compare(current, baseline, threshold):
+    """
+    Compare two result documents.
+
+    Timings are compared on median_ms (lower is better); throughput figures
+    on files_per_s / rows_per_s style keys (higher is better).
+
+    Args:
+        current: Result document from this run
+        baseline: Result document loaded from the baseline file
+        threshold: Allowed relative slowdown, e.g. 0.2 for 20%
+
+    Returns:
+        List of (group, name, metric, baseline, current, ratio, regressed) tuples
+    """
+    rows = []
+    for group, benches in current['results'].items():
+        base_group = baseline.get('results', {}).get(group, {})
+        for name, stats in benches.items():
+            base = base_group.get(name)
+            if not base:
+                continue
+            for metric in ('median_ms', 'files_per_s', 'value', 'seconds'):
+                if metric in stats and metric in base and base[metric]:
+                    ratio = stats[metric] / base[metric]
+                    lower_is_better = metric in ('median_ms', 'seconds')
+                    slowdown = ratio if lower_is_better else (1 / ratio if ratio else float('inf'))
+                    rows.append((group, name, metric, base[metric], stats[metric], round(ratio, 3),
+                                 slowdown > 1 + threshold))
+                    break
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Yurt Radio hot paths on synthetic catalogs.')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma separated catalog sizes (default: %(default)s)')
+    parser.add_argument('--scan-files', type=int, default=200,
+                        help='Number of synthetic files for the scanner benchmark (0 to skip)')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the JSON results')
+    parser.add_argument('--baseline', help='Baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown that counts as a regression (default: %(default)s)')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit non-zero if any benchmark regressed past the threshold')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='yurt-bench-')
+
+    document = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'sizes': sizes,
+            'scan_files': args.scan_files,
+        },
+        'results': {},
+    }
+
+    try:
+        for size in sizes:
+            print(f"Benchmarking catalog of {size} tracks...")
+            document['results'][f'tracks_{size}'] = bench_catalog(size, workdir, rng)
+
+        if args.scan_files:
+            print(f"Benchmarking scanner over {args.scan_files} files...")
+            document['results']['scanner'] = bench_scanner(args.scan_files, workdir)
+    finally:
+        if args.keep:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    for group, benches in document['results'].items():
+        print(f"\n[{group}]")
+        for name, stats in benches.items():
+            print(f"  {name:<28} {json.dumps(stats)}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        rows = compare(document, baseline, args.threshold)
+        regressions = [r for r in rows if r[6]]
+
+        print(f"\nComparison against {args.baseline} (threshold {args.threshold:.0%}):")
+        for group, name, metric, base, cur, ratio, regressed in rows:
+            flag = 'REGRESSION' if regressed else 'ok'
+            print(f"  {group:<16} {name:<28} {metric:<12} {base:>12} -> {cur:<12} x{ratio:<7} {flag}")
+
+        if regressions and args.fail_on_regression:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
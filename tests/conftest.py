@@ -0,0 +1,80 @@
+"""
+Shared fixtures for the Yurt Radio test suite.
+
+Each test gets its own SQLite database and music directory, and the
+in-memory singletons (recent tracks, catalog, caches, ...) are reset
+afterwards so tests don't leak state into each other.
+"""
+
+import os
+import tempfile
+
+# app.py initialises the database at import time, so point it somewhere
+# disposable before anything imports config.
+_scratch = tempfile.mkdtemp(prefix='yurt-radio-tests-')
+os.environ['DB_PATH'] = os.path.join(_scratch, 'import.db')
+os.environ['MUSIC_DIR'] = _scratch
+os.environ.pop('MUSIC_DIRS', None)
+
+import pytest
+import config
+from backend.models import init_db, insert_track
+from tests.synthetic import write_mp3
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    Fresh, migrated database plus an empty music directory.
+
+    Returns:
+        Path of the music directory
+    """
+    music = tmp_path / 'music'
+    music.mkdir()
+    monkeypatch.setattr(config, 'DATABASE_PATH', str(tmp_path / 'yurt_radio.db'))
+    monkeypatch.setattr(config, 'MUSIC_DIRECTORY', str(music))
+    monkeypatch.setattr(config, 'MUSIC_DIRECTORIES', [str(music)])
+    init_db()
+
+    yield music
+
+    from backend.cache import stream_cache
+    from backend.catalog import catalog
+    from backend.history import session_history
+    from backend.services import TrackService
+    from backend.shaping import stream_shaper
+    from backend.shuffle import weighted_sampler
+    from backend.telemetry import telemetry
+
+    TrackService.clear_recent_tracks()
+    catalog._snapshot = None
+    stream_cache.clear()
+    stream_shaper._clients.clear()
+    weighted_sampler._state = None
+    session_history.clear()
+    telemetry._pending.clear()
+
+
+@pytest.fixture
+def client(db):
+    """
+    Flask test client bound to the fresh database.
+    """
+    from app import app
+    return app.test_client()
+
+
+@pytest.fixture
+def add_mp3(db):
+    """
+    Factory that writes a synthetic MP3 into the music directory and inserts it.
+
+    Returns:
+        add_mp3(name, seconds=5) -> track ID
+    """
+    def add(name, seconds=5):
+        path = db / name
+        write_mp3(str(path), seconds)
+        return insert_track(name, f'hash-{name}', name, 'Test', seconds, path.stat().st_size)
+    return add
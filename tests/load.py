@@ -0,0 +1,395 @@
+"""
+Concurrent listener load test for the Yurt Radio API.
+
+Simulates N radio.js clients against a running server. Each listener loops:
+fetch /api/track/random, stream the track with ranged /api/stream/<id>
+requests paced at a realistic bitrate, and poll /api/stats now and then.
+Latency percentiles, time-to-first-byte, error rates and throughput are
+reported per endpoint.
+
+By default a local server is started on a scratch database filled with a
+synthetic library, so nothing touches the real catalog.
+
+Usage:
+    python -m tests.load --listeners 50 --duration 30
+    python -m tests.load --ramp 10,25,50,100,200 --duration 20 --output load.json
+    python -m tests.load --url http://127.0.0.1:5000 --listeners 20
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend.models import get_db, init_db
+from tests import synthetic
+
+
+def percentile(sorted_samples, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+
+    Args:
+        sorted_samples: Sorted list of numbers
+        pct: Percentile between 0 and 100
+
+    Returns:
+        The percentile value, or None for an empty list
+    """
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, int(round(pct / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+class Recorder:
+    """
+    Thread-safe collector for per-endpoint samples.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.ttfb = {}
+        self.errors = {}
+        self.requests = {}
+        self.bytes = 0
+
+    def record(self, endpoint, latency, ttfb=None, nbytes=0, error=False):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes += nbytes
+            if error:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+                return
+            self.latency.setdefault(endpoint, []).append(latency)
+            if ttfb is not None:
+                self.ttfb.setdefault(endpoint, []).append(ttfb)
+
+    def summary(self, elapsed):
+        """
+        Summarise everything recorded so far.
+
+        Args:
+            elapsed: Wall clock length of the run in seconds
+
+        Returns:
+            Dictionary with per-endpoint percentiles and overall throughput
+        """
+        def pcts(samples):
+            samples = sorted(samples)
+            return {
+                'p50_ms': _ms(percentile(samples, 50)),
+                'p95_ms': _ms(percentile(samples, 95)),
+                'p99_ms': _ms(percentile(samples, 99)),
+                'max_ms': _ms(samples[-1] if samples else None),
+            }
+
+        with self.lock:
+            endpoints = {}
+            for endpoint, total in self.requests.items():
+                errors = self.errors.get(endpoint, 0)
+                endpoints[endpoint] = {
+                    'requests': total,
+                    'errors': errors,
+                    'error_rate': round(errors / total, 4),
+                    'requests_per_s': round(total / elapsed, 2),
+                    'latency': pcts(self.latency.get(endpoint, [])),
+                }
+                if endpoint in self.ttfb:
+                    endpoints[endpoint]['ttfb'] = pcts(self.ttfb[endpoint])
+
+            total = sum(self.requests.values())
+            errors = sum(self.errors.values())
+            return {
+                'elapsed_s': round(elapsed, 2),
+                'requests': total,
+                'errors': errors,
+                'error_rate': round(errors / total, 4) if total else 0.0,
+                'requests_per_s': round(total / elapsed, 2),
+                'mbit_per_s': round(self.bytes * 8 / elapsed / 1e6, 3),
+                'endpoints': endpoints,
+            }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class Listener(threading.Thread):
+    """
+    One simulated radio.js client.
+
+    Streaming is paced at `bitrate` bits per second of audio, sped up by
+    `speed` so a test run can cover many tracks without waiting for them.
+    """
+
+    def __init__(self, base_url, recorder, stop, bitrate, chunk_seconds, listen_seconds,
+                 speed, stats_every, seed):
+        super().__init__(daemon=True)
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.recorder = recorder
+        self.stop = stop
+        self.bitrate = bitrate
+        self.chunk_bytes = int(bitrate / 8 * chunk_seconds)
+        self.chunk_interval = chunk_seconds / speed
+        self.listen_seconds = listen_seconds
+        self.stats_every = stats_every
+        self.rng = random.Random(seed)
+        self.conn = None
+        # Session cookie from /api/track/random, sent back like a browser would
+        self.cookie = None
+
+    def _request(self, endpoint, path, headers=None, expect=(200,)):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+
+        t0 = time.perf_counter()
+        try:
+            self.conn.request('GET', self.prefix + path, headers=headers)
+            resp = self.conn.getresponse()
+            first = resp.read(1)
+            ttfb = time.perf_counter() - t0
+            body = first + resp.read()
+            latency = time.perf_counter() - t0
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            self.recorder.record(endpoint, time.perf_counter() - t0, error=True)
+            return None
+
+        set_cookie = resp.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+
+        ok = resp.status in expect
+        self.recorder.record(endpoint, latency, ttfb=ttfb, nbytes=len(body), error=not ok)
+        if resp.getheader('Connection', '').lower() == 'close':
+            self.conn.close()
+            self.conn = None
+        return (resp, body) if ok else None
+
+    def _sleep(self, seconds):
+        return self.stop.wait(seconds)
+
+    def run(self):
+        tracks_since_stats = self.stats_every
+
+        # Stagger start-up so listeners don't arrive in lockstep.
+        if self._sleep(self.rng.uniform(0, self.chunk_interval)):
+            return
+
+        while not self.stop.is_set():
+            if tracks_since_stats >= self.stats_every:
+                self._request('/api/stats', '/api/stats')
+                tracks_since_stats = 0
+
+            result = self._request('/api/track/random', '/api/track/random')
+            if result is None:
+                self._sleep(1)
+                continue
+            track = json.loads(result[1])
+            tracks_since_stats += 1
+
+            # Listen to a random slice of the track; radio.js users skip a lot.
+            listen = min(track.get('duration') or self.listen_seconds, self.listen_seconds)
+            listen *= self.rng.uniform(0.3, 1.0)
+            offset = 0
+
+            while not self.stop.is_set():
+                rng_header = {'Range': f'bytes={offset}-{offset + self.chunk_bytes - 1}'}
+                result = self._request('/api/stream', track['stream_url'], rng_header, expect=(200, 206))
+                if result is None:
+                    break
+                resp, body = result
+                offset += len(body)
+
+                total = resp.getheader('Content-Range', '').rpartition('/')[2]
+                if not body or (total.isdigit() and offset >= int(total)):
+                    break
+                if offset * 8 / self.bitrate >= listen:
+                    break
+                if self._sleep(self.chunk_interval):
+                    break
+
+        if self.conn is not None:
+            self.conn.close()
+
+
+def run_stage(base_url, listeners, duration, args):
+    """
+    Run one load stage with a fixed number of listeners.
+
+    Args:
+        base_url: Server base URL, e.g. http://127.0.0.1:5000
+        listeners: Number of concurrent listeners
+        duration: Stage length in seconds
+        args: Parsed command line arguments
+
+    Returns:
+        Summary dictionary from Recorder.summary()
+    """
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        Listener(base_url, recorder, stop, args.bitrate, args.chunk_seconds, args.listen_seconds,
+                 args.speed, args.stats_every, seed=args.seed + i)
+        for i in range(listeners)
+    ]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    stop.wait(duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=35)
+    elapsed = time.perf_counter() - started
+
+    summary = recorder.summary(elapsed)
+    summary['listeners'] = listeners
+    return summary
+
+
+def start_local_server(workdir, tracks, files, track_seconds, port):
+    """
+    Start the app in a background thread on a synthetic library.
+
+    Creates `files` real MP3 files and `tracks` catalog rows that point at
+    them round-robin, so a large catalog needs little disk.
+
+    Args:
+        workdir: Scratch directory for the database and audio files
+        tracks: Number of catalog rows
+        files: Number of real audio files backing those rows
+        track_seconds: Length of each audio file
+        port: Port to listen on (0 picks a free port)
+
+    Returns:
+        (server, base_url)
+    """
+    from werkzeug.serving import make_server
+
+    music_dir = os.path.join(workdir, 'music')
+    os.makedirs(music_dir, exist_ok=True)
+    config.MUSIC_DIRECTORY = music_dir
+    config.MUSIC_DIRECTORIES = [music_dir]
+    config.DATABASE_PATH = os.path.join(workdir, 'load.db')
+    config.DEBUG = False
+
+    for i in range(files):
+        synthetic.write_mp3(os.path.join(music_dir, f'pool_{i}.mp3'), track_seconds)
+
+    init_db()
+    synthetic.populate_tracks(tracks, seed=tracks)
+    with get_db() as conn:
+        conn.execute("UPDATE tracks SET file_path = 'pool_' || (id % ?) || '.mp3', duration = ?",
+                     (files, track_seconds))
+
+    import app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def print_stage(summary):
+    print(f"\n=== {summary['listeners']} listeners | {summary['requests_per_s']} req/s | "
+          f"{summary['mbit_per_s']} Mbit/s | errors {summary['error_rate']:.2%} ===")
+    for endpoint, stats in sorted(summary['endpoints'].items()):
+        lat = stats['latency']
+        line = (f"  {endpoint:<18} n={stats['requests']:<7} err={stats['error_rate']:<7.2%} "
+                f"p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms p99={lat['p99_ms']}ms")
+        if 'ttfb' in stats:
+            line += f" ttfb_p95={stats['ttfb']['p95_ms']}ms"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate concurrent Yurt Radio listeners.')
+    parser.add_argument('--url', help='Target an already running server instead of starting one')
+    parser.add_argument('--listeners', type=int, default=20, help='Concurrent listeners (default: %(default)s)')
+    parser.add_argument('--ramp', help='Comma separated listener counts to run as successive stages')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per stage (default: %(default)s)')
+    parser.add_argument('--bitrate', type=int, default=128000, help='Audio bitrate in bits/s (default: %(default)s)')
+    parser.add_argument('--chunk-seconds', type=float, default=10,
+                        help='Seconds of audio fetched per range request (default: %(default)s)')
+    parser.add_argument('--listen-seconds', type=float, default=120,
+                        help='Maximum seconds of each track a listener plays (default: %(default)s)')
+    parser.add_argument('--speed', type=float, default=10,
+                        help='Playback speed-up so runs cover more tracks (default: %(default)s)')
+    parser.add_argument('--stats-every', type=int, default=3,
+                        help='Poll /api/stats every N tracks, like a page refresh (default: %(default)s)')
+    parser.add_argument('--tracks', type=int, default=10000, help='Synthetic catalog rows for the local server')
+    parser.add_argument('--files', type=int, default=20, help='Real audio files backing the catalog')
+    parser.add_argument('--track-seconds', type=int, default=240, help='Length of each synthetic file')
+    parser.add_argument('--port', type=int, default=0, help='Port for the local server (default: any free port)')
+    parser.add_argument('--max-p95-ms', type=float, default=500,
+                        help='Ramp stops once any endpoint p95 exceeds this (default: %(default)s)')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='Ramp stops once the error rate exceeds this (default: %(default)s)')
+    parser.add_argument('--output', help='Write all stage summaries to this JSON file')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    stages = [int(n) for n in args.ramp.split(',')] if args.ramp else [args.listeners]
+    workdir = None
+    server = None
+
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        workdir = tempfile.mkdtemp(prefix='yurt-load-')
+        print(f"Starting local server on a synthetic library ({args.tracks} tracks, {args.files} files)...")
+        server, base_url = start_local_server(workdir, args.tracks, args.files, args.track_seconds, args.port)
+    print(f"Target: {base_url}")
+
+    summaries = []
+    saturated_at = None
+    try:
+        for listeners in stages:
+            summary = run_stage(base_url, listeners, args.duration, args)
+            summaries.append(summary)
+            print_stage(summary)
+
+            worst_p95 = max((s['latency']['p95_ms'] or 0 for s in summary['endpoints'].values()), default=0)
+            if summary['error_rate'] > args.max_error_rate or worst_p95 > args.max_p95_ms:
+                saturated_at = listeners
+                if args.ramp:
+                    print(f"\nSaturation reached at {listeners} listeners "
+                          f"(p95 {worst_p95}ms, errors {summary['error_rate']:.2%}).")
+                break
+    finally:
+        if server is not None:
+            server.shutdown()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'target': base_url, 'saturated_at': saturated_at, 'stages': summaries}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
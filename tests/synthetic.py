@@ -0,0 +1,178 @@
+"""
+Synthetic library generator for Yurt Radio benchmarks.
+
+Builds fake catalogs directly in the tracks table and writes small, valid
+WAV/MP3 files so the scanner and stream endpoint have something real to read.
+Nothing here touches the configured music directory or database unless you
+point it there.
+"""
+
+import hashlib
+import os
+import random
+import struct
+import wave
+
+from backend.models import get_db, init_db
+
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no CRC, no padding, joint stereo.
+MP3_FRAME_HEADER = b'\xff\xfb\x90\x40'
+MP3_FRAME_SIZE = 417
+MP3_FRAME_SECONDS = 1152 / 44100
+MP3_BITRATE = 128000
+
+AUTHORS = ['Yurt Collective', 'Malcom', 'Brutal Online', 'Unknown', 'DOS 437', 'Steppe Tapes']
+WORDS = ['night', 'drive', 'tape', 'felt', 'steppe', 'signal', 'static', 'ember', 'loop', 'canvas']
+
+
+def synthetic_hash(index, seed=0):
+    """
+    Deterministic fake file hash for a synthetic track.
+
+    Args:
+        index: Track index within the synthetic catalog
+        seed: Catalog seed, so different catalogs don't collide
+
+    Returns:
+        40 character hex string shaped like a SHA-1 digest
+    """
+    return hashlib.sha1(f'synthetic-{seed}-{index}'.encode()).hexdigest()
+
+
+def _synthetic_rows(count, seed, start_index, file_ext):
+    rng = random.Random(seed)
+    now = 1_700_000_000
+
+    for i in range(start_index, start_index + count):
+        title = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}"
+        duration = rng.randint(60, 600)
+        play_count = int(rng.paretovariate(1.5)) - 1
+        last_played = None
+        if play_count:
+            ts = now - rng.randint(0, 90 * 86400)
+            last_played = f"{ts}"
+
+        yield (
+            f"synthetic/track_{i:07d}{file_ext}",
+            synthetic_hash(i, seed),
+            title,
+            rng.choice(AUTHORS),
+            duration,
+            duration * MP3_BITRATE // 8,
+            play_count,
+            last_played,
+        )
+
+
+def populate_tracks(count, seed=0, start_index=0, file_ext='.mp3'):
+    """
+    Bulk insert synthetic rows into the tracks table.
+
+    Rows are inserted in a single transaction so even 1M tracks only take a
+    few seconds. Play counts follow a long-tailed distribution so stats and
+    weighted queries see realistic skew.
+
+    Args:
+        count: Number of rows to insert
+        seed: Random seed for titles, durations and play counts
+        start_index: First index used for file names and hashes
+        file_ext: Extension used for the fake file paths
+
+    Returns:
+        Number of rows inserted
+    """
+    init_db()
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO tracks (file_path, file_hash, title, author, duration, file_size, play_count, last_played)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime(?, 'unixepoch'))
+        """, _synthetic_rows(count, seed, start_index, file_ext))
+
+        return cursor.rowcount
+
+
+def write_mp3(path, seconds):
+    """
+    Write a silent, decodable-header MP3 file.
+
+    The file is a run of constant bitrate MPEG-1 Layer III frames with empty
+    payloads. Mutagen reads it as a 128 kbps stream of the given length.
+
+    Args:
+        path: Destination file path
+        seconds: Approximate length of the file in seconds
+
+    Returns:
+        Size of the written file in bytes
+    """
+    frames = max(1, int(seconds / MP3_FRAME_SECONDS))
+    frame = MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+
+    with open(path, 'wb') as f:
+        for _ in range(frames):
+            f.write(frame)
+
+    return frames * MP3_FRAME_SIZE
+
+
+def write_wav(path, seconds, sample_rate=8000, seed=0):
+    """
+    Write a short mono 16-bit WAV file filled with low-level noise.
+
+    Noise rather than silence keeps every file's hash unique.
+
+    Args:
+        path: Destination file path
+        seconds: Length of the file in seconds
+        sample_rate: Samples per second
+        seed: Random seed for the noise
+
+    Returns:
+        Size of the written file in bytes
+    """
+    rng = random.Random(seed)
+    frames = int(seconds * sample_rate)
+
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(struct.pack(f'<{frames}h', *(rng.randint(-64, 64) for _ in range(frames))))
+
+    return os.path.getsize(path)
+
+
+def write_library(directory, count, seconds=2, seed=0):
+    """
+    Fill a directory with synthetic audio files for scanner tests.
+
+    Alternates between WAV and MP3. MP3 files get a unique trailing tag so
+    their hashes differ even though the frames are identical.
+
+    Args:
+        directory: Directory to write into (created if missing)
+        count: Number of files to write
+        seconds: Length of each file in seconds
+        seed: Random seed
+
+    Returns:
+        Total number of bytes written
+    """
+    os.makedirs(directory, exist_ok=True)
+    total = 0
+
+    for i in range(count):
+        if i % 2:
+            path = os.path.join(directory, f"synthetic_{seed}_{i:06d}.mp3")
+            total += write_mp3(path, seconds)
+            with open(path, 'ab') as f:
+                f.write(f"TAG{seed}-{i}".encode().ljust(128, b'\0'))
+            total += 128
+        else:
+            path = os.path.join(directory, f"synthetic_{seed}_{i:06d}.wav")
+            total += write_wav(path, seconds, seed=seed * 1_000_003 + i)
+
+    return total
@@ -0,0 +1,136 @@
+import threading
+import time
+import pytest
+import config
+from backend.cache import CachedFile, _Entry, stream_cache, TrackByteCache
+
+
+def _wait_for_entries(count, timeout=5):
+    deadline = time.time() + timeout
+    while stream_cache.stats()['entries'] != count or stream_cache.stats()['loading']:
+        assert time.time() < deadline, stream_cache.stats()
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def cached(db, monkeypatch):
+    monkeypatch.setattr(config, 'STREAM_CACHE_ENABLED', True)
+    monkeypatch.setattr(config, 'STREAM_CACHE_ADMIT_AFTER', 2)
+
+
+def test_iter_range_matches_slices():
+    data = bytes(range(23))
+    chunk = 5
+    cached = CachedFile(_Entry([data[i:i + chunk] for i in range(0, len(data), chunk)], len(data), 0), chunk)
+
+    for start in range(len(data) + 1):
+        for stop in range(start, len(data) + 1):
+            assert b''.join(cached.iter_range(start, stop)) == data[start:stop]
+
+
+def test_iter_range_reuses_whole_chunks():
+    chunks = [b'aaaa', b'bbbb', b'cccc']
+    cached = CachedFile(_Entry(chunks, 12, 0), 4)
+
+    parts = list(cached.iter_range(2, 12))
+    assert parts[1] is chunks[1] and parts[2] is chunks[2]
+    assert list(cached.iter_range(4, 4)) == []
+
+
+def test_range_requests_within_a_play_do_not_admit(client, cached, add_mp3):
+    track_id = add_mp3('a.mp3', seconds=30)
+
+    client.get(f'/api/stream/{track_id}', headers={'Range': 'bytes=0-999'})
+    for start in range(1000, 20000, 1000):
+        rv = client.get(f'/api/stream/{track_id}', headers={'Range': f'bytes={start}-{start + 999}'})
+        assert rv.status_code == 206
+
+    time.sleep(0.05)
+    assert stream_cache.stats()['entries'] == 0
+
+
+def test_second_start_admits_in_background(client, cached, add_mp3, db):
+    track_id = add_mp3('a.mp3', seconds=30)
+    body = (db / 'a.mp3').read_bytes()
+
+    client.get(f'/api/stream/{track_id}')
+    rv = client.get(f'/api/stream/{track_id}')
+    assert rv.data == body
+    _wait_for_entries(1)
+
+    hits = stream_cache.hits
+    rv = client.get(f'/api/stream/{track_id}', headers={'Range': 'bytes=100-199'})
+    assert rv.status_code == 206 and rv.data == body[100:200]
+    assert stream_cache.hits == hits + 1
+
+
+def test_etag_matches_on_disk_and_cached_paths(client, cached, add_mp3, db):
+    track_id = add_mp3('a.mp3', seconds=30)
+    body = (db / 'a.mp3').read_bytes()
+    url = f'/api/stream/{track_id}'
+
+    from_disk = client.get(url)
+    etag = from_disk.headers['ETag']
+    client.get(url)
+    _wait_for_entries(1)
+    hits = stream_cache.hits
+    from_cache = client.get(url)
+    assert stream_cache.hits == hits + 1
+    assert from_cache.headers['ETag'] == etag
+
+    for _ in range(2):
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+        rv = client.get(url, headers={'If-Range': etag, 'Range': 'bytes=10-19'})
+        assert rv.status_code == 206 and rv.data == body[10:20]
+        stream_cache.clear()
+
+
+def test_loads_in_flight_are_reserved_against_the_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'STREAM_CACHE_ADMIT_AFTER', 1)
+    monkeypatch.setattr(config, 'STREAM_CACHE_MAX_BYTES', 2500)
+    paths = []
+    for i in range(5):
+        paths.append(tmp_path / f'{i}.mp3')
+        paths[-1].write_bytes(bytes(1000))
+
+    cache = TrackByteCache()
+    release = threading.Event()
+    load = cache._load
+
+    def slow_load(path, st):
+        release.wait(5)
+        return load(path, st)
+    monkeypatch.setattr(cache, '_load', slow_load)
+
+    for path in paths:
+        assert cache.get(str(path)) is None
+    assert cache.stats()['loading'] == 2 and cache.stats()['reserved_bytes'] == 2000
+
+    release.set()
+    deadline = time.time() + 5
+    while cache.stats()['loading']:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert cache.stats()['entries'] == 2 and cache.stats()['bytes'] == 2000
+    assert cache.stats()['reserved_bytes'] == 0
+
+
+def test_cached_segments_are_served_from_memory(client, cached, add_mp3, db, monkeypatch):
+    monkeypatch.setattr(config, 'SEGMENTS_ENABLED', True)
+    track_id = add_mp3('a.mp3', seconds=20)
+    body = (db / 'a.mp3').read_bytes()
+
+    playlist = client.get(f'/api/stream/{track_id}/playlist.m3u8')
+    urls = [line for line in playlist.text.splitlines() if line.startswith('/api/segment/')]
+    client.get(urls[0])
+    client.get(urls[0])
+    _wait_for_entries(1)
+
+    hits = stream_cache.hits
+    parts = [client.get(url) for url in urls]
+    assert stream_cache.hits == hits + len(urls)
+    assert all(int(rv.headers['Content-Length']) == len(rv.data) for rv in parts)
+    assert b''.join(rv.data for rv in parts) == body
+
+    rv = client.get(urls[1], headers={'Range': 'bytes=10-19'})
+    assert rv.status_code == 206 and rv.data == parts[1].data[10:20]
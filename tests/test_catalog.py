@@ -0,0 +1,65 @@
+import time
+import config
+from backend.catalog import catalog
+from backend.models import get_db, get_catalog_generation, bump_catalog_generation, insert_track
+from scripts.scan_music import rescan_music_directory, export_manifest, import_manifest
+from tests.synthetic import write_mp3
+
+
+def _generation():
+    with get_db() as conn:
+        return get_catalog_generation(conn.cursor())
+
+
+def test_rescan_bumps_generation_only_on_changes(db):
+    write_mp3(str(db / 'a.mp3'), 2)
+    write_mp3(str(db / 'b.mp3'), 3)
+
+    rescan_music_directory()
+    generation = _generation()
+    assert generation > 0
+
+    rescan_music_directory()
+    assert _generation() == generation
+
+    (db / 'b.mp3').unlink()
+    rescan_music_directory()
+    assert _generation() == generation + 1
+
+
+def test_reimporting_the_same_manifest_keeps_generation(db, tmp_path):
+    write_mp3(str(db / 'a.mp3'), 2)
+    rescan_music_directory()
+    manifest = tmp_path / 'tracks.jsonl.gz'
+    export_manifest(str(manifest))
+
+    generation = _generation()
+    assert import_manifest(str(manifest), verify=False) == 0
+    assert _generation() == generation
+
+
+def test_generation_bump_swaps_in_a_new_snapshot(client, monkeypatch):
+    monkeypatch.setattr(config, 'CATALOG_ENABLED', True)
+    monkeypatch.setattr(config, 'CATALOG_REFRESH_SECONDS', 0)
+    insert_track('a.mp3', 'hash-a', 'A', 'Test', 60, 1000)
+    catalog.load()
+    old = catalog.snapshot()
+    assert client.get('/api/tracks').json['total'] == 1
+
+    # Unchanged generation: the background check keeps the same snapshot
+    time.sleep(0.01)
+    catalog.snapshot()
+    while catalog._refreshing:
+        time.sleep(0.01)
+    assert catalog.snapshot() is old
+
+    insert_track('b.mp3', 'hash-b', 'B', 'Test', 60, 1000)
+    bump_catalog_generation()
+    deadline = time.time() + 5
+    while catalog._snapshot is old:
+        assert time.time() < deadline
+        catalog.snapshot()
+        time.sleep(0.01)
+
+    assert catalog.snapshot().generation == old.generation + 1
+    assert client.get('/api/tracks').json['total'] == 2
@@ -0,0 +1,124 @@
+import pytest
+import config
+from backend.catalog import catalog
+from backend.history import FilterShape, RotatingBloomFilter, ListenerHistory, session_history
+from backend.services import TrackService
+from tests.synthetic import populate_tracks
+
+
+def test_filter_remembers_the_whole_window():
+    shape = FilterShape(100, 4, 0.02)
+    history = RotatingBloomFilter(shape)
+
+    for track_id in range(1, 1001):
+        history.add(track_id)
+        window = range(max(1, track_id - 99), track_id + 1)
+        assert all(t in history for t in window)
+
+
+def test_rotation_clears_the_oldest_generation():
+    shape = FilterShape(30, 4, 0.02)
+    history = RotatingBloomFilter(shape)
+
+    for track_id in range(1, shape.capacity + 1):
+        history.add(track_id)
+    # Fill the other generations once more so the first one is reused
+    for track_id in range(1000, 1000 + shape.capacity * shape.generations):
+        history.add(track_id)
+
+    assert not any(t in history for t in range(1, shape.capacity + 1))
+
+
+def test_false_positive_rate_stays_near_target():
+    shape = FilterShape(500, 4, 0.02)
+    history = RotatingBloomFilter(shape)
+    for track_id in range(1, 5001):
+        history.add(track_id)
+
+    unseen = range(1_000_000, 1_020_000)
+    rate = sum(t in history for t in unseen) / len(unseen)
+    assert rate < 0.03
+
+
+def test_listener_history_keeps_exact_recent_ids():
+    history = ListenerHistory(FilterShape(50, 4, 0.02))
+    for track_id in range(1, 26):
+        history.add(track_id)
+
+    assert history.recent_ids() == list(range(26 - config.MAX_RECENT_TRACKS, 26))
+    assert 25 in history
+
+
+@pytest.mark.parametrize('use_catalog', [False, True])
+@pytest.mark.parametrize('weighted', [False, True])
+def test_small_library_never_repeats_within_recent_window(db, monkeypatch, use_catalog, weighted):
+    monkeypatch.setattr(config, 'WEIGHTED_SHUFFLE_ENABLED', weighted)
+    populate_tracks(30, seed=5)
+    if use_catalog:
+        monkeypatch.setattr(config, 'CATALOG_ENABLED', True)
+        catalog.load()
+    session = session_history.new_token()
+
+    picks = []
+    for _ in range(300):
+        if use_catalog:
+            track_id = TrackService.get_next_track_id(catalog.snapshot(), session)
+        else:
+            track_id = TrackService.get_next_track(session)['id']
+        assert track_id not in picks[-config.MAX_RECENT_TRACKS:]
+        picks.append(track_id)
+
+
+def test_tiny_library_still_plays(db):
+    populate_tracks(3, seed=5)
+    session = session_history.new_token()
+    assert all(TrackService.get_next_track(session) is not None for _ in range(20))
+
+
+def test_cookieless_requests_use_the_global_list(client):
+    populate_tracks(30, seed=5)
+
+    picks = []
+    for _ in range(50):
+        client.delete_cookie(config.SESSION_COOKIE_NAME)
+        rv = client.get('/api/track/random')
+        assert rv.status_code == 200
+        assert config.SESSION_COOKIE_NAME in rv.headers['Set-Cookie']
+        assert rv.json['id'] not in picks[-config.MAX_RECENT_TRACKS:]
+        picks.append(rv.json['id'])
+
+    assert session_history.stats()['sessions'] == 0
+
+
+def test_returning_listener_gets_a_session(client):
+    populate_tracks(30, seed=5)
+
+    client.get('/api/track/random')
+    for _ in range(5):
+        assert client.get('/api/track/random').status_code == 200
+    assert session_history.stats()['sessions'] == 1
+
+
+def test_session_tokens_are_signed(monkeypatch):
+    token = session_history.new_token()
+    assert session_history.verify_token(token)
+
+    value, _, signature = token.partition('.')
+    assert not session_history.verify_token(value)
+    assert not session_history.verify_token(f'{value}x.{signature}')
+    assert not session_history.verify_token('a' * 64)
+
+    monkeypatch.setattr(config, 'SESSION_SECRET', 'rotated')
+    assert not session_history.verify_token(token)
+
+
+def test_made_up_cookies_are_treated_as_new_sessions(client):
+    populate_tracks(30, seed=5)
+
+    for i in range(20):
+        client.set_cookie(config.SESSION_COOKIE_NAME, f'made-up-{i}')
+        rv = client.get('/api/track/random')
+        assert rv.status_code == 200
+        assert config.SESSION_COOKIE_NAME in rv.headers['Set-Cookie']
+
+    assert session_history.stats()['sessions'] == 0
@@ -0,0 +1,72 @@
+import gzip
+import json
+import pytest
+import config
+from backend.catalog import catalog
+from backend.models import get_db, get_track_by_id, submit_ratings, update_play_count
+from scripts.scan_music import export_manifest, import_manifest, MANIFEST_FORMAT, MANIFEST_VERSION
+from tests.synthetic import populate_tracks
+
+
+def _write_manifest(path, lines):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION}) + '\n')
+        for line in lines:
+            f.write(line + '\n')
+
+
+def _track_count():
+    with get_db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+
+def _row(i, **fields):
+    row = {'id': i, 'file_path': f'{i}.mp3', 'music_root': None, 'file_hash': f'hash-{i}',
+           'title': f'Track {i}', 'author': 'Test', 'duration': 60, 'file_size': 1000}
+    row.update(fields)
+    return json.dumps(row)
+
+
+def test_export_import_round_trip(db, tmp_path):
+    populate_tracks(25, seed=2)
+    manifest = tmp_path / 'tracks.jsonl.gz'
+    export_manifest(str(manifest))
+
+    with get_db() as conn:
+        conn.execute("DELETE FROM tracks")
+    assert import_manifest(str(manifest), verify=False) == 25
+    assert _track_count() == 25
+
+
+def test_corrupt_manifest_imports_nothing(db, tmp_path):
+    manifest = tmp_path / 'bad.jsonl.gz'
+    _write_manifest(manifest, [_row(1), _row(2), '{"id": 3, "file_pa'])
+
+    with pytest.raises(json.JSONDecodeError):
+        import_manifest(str(manifest), verify=False)
+    assert _track_count() == 0
+
+
+def test_missing_counters_default_to_zero(client, tmp_path):
+    manifest = tmp_path / 'old.jsonl.gz'
+    _write_manifest(manifest, [_row(1), _row(2, play_count=None, average_rating=None)])
+    import_manifest(str(manifest), verify=False)
+
+    track = get_track_by_id(2)
+    assert (track['play_count'], track['rating_count'], track['average_rating']) == (0, 0, 0.0)
+    assert client.get('/api/track/1').status_code == 200
+    assert client.get('/api/track/random').status_code == 200
+
+
+def test_db_and_catalog_track_documents_match(client, monkeypatch):
+    populate_tracks(5, seed=2)
+    submit_ratings([(3, 5), (3, 4), (3, 4)])
+    update_play_count(3)
+    from_db = client.get('/api/track/3').json
+    page_from_db = client.get('/api/tracks').json['tracks']
+
+    monkeypatch.setattr(config, 'CATALOG_ENABLED', True)
+    catalog.load()
+    assert from_db == client.get('/api/track/3').json
+    assert page_from_db == client.get('/api/tracks').json['tracks']
+    assert from_db['average_rating'] == 4.33
@@ -0,0 +1,51 @@
+import sqlite3
+import config
+from backend.models import init_db, get_schema_version, get_db, MIGRATIONS
+
+
+def _schema():
+    with get_db() as conn:
+        return sorted(tuple(row) for row in conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE name != 'sqlite_sequence'"))
+
+
+def test_init_db_is_idempotent(db):
+    schema = _schema()
+    init_db()
+    init_db()
+
+    assert _schema() == schema
+    assert get_schema_version() == MIGRATIONS[-1][0]
+    with get_db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(MIGRATIONS)
+
+
+def test_adopts_database_from_before_versioning(tmp_path, monkeypatch):
+    path = tmp_path / 'old.db'
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE tracks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT NOT NULL,
+            file_hash TEXT UNIQUE NOT NULL,
+            title TEXT,
+            author TEXT,
+            duration INTEGER,
+            file_size INTEGER,
+            play_count INTEGER DEFAULT 0,
+            last_played DATETIME);
+        CREATE INDEX idx_tracks_file_path ON tracks(file_path);
+        INSERT INTO tracks (file_path, file_hash, title, play_count) VALUES ('a.mp3', 'h1', 'A', 7);
+    ''')
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(config, 'DATABASE_PATH', str(path))
+    init_db()
+
+    assert get_schema_version() == MIGRATIONS[-1][0]
+    with get_db() as conn:
+        row = conn.execute("SELECT title, play_count, rating_count FROM tracks").fetchone()
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert tuple(row) == ('A', 7, 0)
+    assert 'idx_tracks_file_path' not in indexes
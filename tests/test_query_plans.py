@@ -0,0 +1,70 @@
+"""
+Query plan check: every *_SQL statement in backend.models must use an index,
+apart from the ones listed in ALLOWED_SCANS with the reason they don't need
+one. A new full scan or temporary sort usually means a migration forgot an
+index or a query stopped matching one.
+"""
+
+import re
+import pytest
+from backend import models
+from backend.models import get_db
+
+# name -> why a full scan or temporary B-tree is acceptable for it
+ALLOWED_SCANS = {
+    'RANDOM_TRACK_SQL': "ORDER BY RANDOM() reads every row; only used when the in-memory catalog is disabled",
+    'RANDOM_TRACK_EXCLUDING_SQL': "as RANDOM_TRACK_SQL",
+    'RANDOM_TRACKS_SQL': "as RANDOM_TRACK_SQL",
+    'TRACKS_PAGE_SQL': "pages in rowid order, so it reads offset + limit rows and stops",
+    'TOTAL_DURATION_SQL': "sums every track for /api/stats",
+    'ROLLUP_PLAYS_SQL': "reads only play events since the last rollup; grouping them by bucket needs a sort",
+    'ROLLUP_TOTALS_SQL': "as ROLLUP_PLAYS_SQL",
+    'TELEMETRY_BY_TRACK_SQL': "groups the requested window by track and ranks by mean, which no index can order",
+}
+
+# Indexes no planned statement uses, with what they are for
+UNPLANNED_INDEXES = {
+    'idx_track_ratings': "deleting the ratings of tracks the scanner removed",
+}
+
+# "SCAN tracks" is a full table scan; "SCAN tracks USING INDEX ..." walks an
+# index in order and is fine for ORDER BY ... LIMIT queries.
+_FULL_SCAN = re.compile(r'^SCAN \S+$|^SCAN \S+ USING (?!.*INDEX)|USE TEMP B-TREE')
+_INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+QUERIES = sorted(name for name in dir(models) if name.endswith('_SQL'))
+
+
+def explain(sql):
+    """
+    Get the query plan for a statement, with ? placeholders bound to NULL.
+
+    Returns:
+        List of plan step descriptions
+    """
+    sql = sql.format(ids='1, 2, 3') if '{ids}' in sql else sql
+    with get_db() as conn:
+        return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, (None,) * sql.count('?'))]
+
+
+@pytest.mark.parametrize('name', QUERIES)
+def test_query_plan(db, name):
+    scans = [step for step in explain(getattr(models, name)) if _FULL_SCAN.search(step)]
+
+    if name in ALLOWED_SCANS:
+        assert scans, f"{name} no longer scans; remove it from ALLOWED_SCANS"
+    else:
+        assert not scans, f"{name} plan: {scans}"
+
+
+def test_allowlists_name_real_queries(db):
+    assert set(ALLOWED_SCANS) <= set(QUERIES)
+
+
+def test_every_index_is_used(db):
+    used = {m for name in QUERIES for step in explain(getattr(models, name)) for m in _INDEX.findall(step)}
+    with get_db() as conn:
+        indexes = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_autoindex_%'")}
+
+    assert indexes - used == set(UNPLANNED_INDEXES)
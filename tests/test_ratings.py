@@ -0,0 +1,136 @@
+import threading
+import time
+import pytest
+from backend import services
+from backend.models import get_db, get_track_rating, submit_ratings, update_play_count, del_by_unseen_hash
+from backend.models import add_telemetry, TELEMETRY_BIN_COLUMNS, TRACK_DEPENDENT_TABLES
+from backend.rollups import play_rollups
+from backend.services import RatingService
+from tests.synthetic import populate_tracks
+
+
+def test_submit_ratings_keeps_running_aggregates(db):
+    populate_tracks(2)
+
+    assert submit_ratings([(1, 5), (1, 4), (2, 1), (99, 3)]) == {
+        1: {'average': 4.5, 'count': 2},
+        2: {'average': 1.0, 'count': 1},
+    }
+    assert submit_ratings([(1, 3)]) == {1: {'average': 4.0, 'count': 3}}
+    assert get_track_rating(1) == {'average': 4.0, 'count': 3}
+
+    with get_db() as conn:
+        rows = conn.execute("SELECT track_id, COUNT(*), SUM(rating) FROM ratings GROUP BY track_id").fetchall()
+    assert [tuple(r) for r in rows] == [(1, 3, 12), (2, 1, 1)]
+
+
+def test_concurrent_ratings_are_group_committed(db, monkeypatch):
+    populate_tracks(1)
+    commits = []
+
+    def slow_submit(ratings):
+        commits.append(1)
+        time.sleep(0.05)
+        return submit_ratings(ratings)
+    monkeypatch.setattr(services, 'submit_ratings', slow_submit)
+
+    submitters = 20
+    barrier = threading.Barrier(submitters)
+    results = [None] * submitters
+
+    def rate(i):
+        barrier.wait()
+        results[i] = RatingService.submit(1, 1 + i % 5)
+
+    threads = [threading.Thread(target=rate, args=(i,)) for i in range(submitters)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert get_track_rating(1) == {'average': 3.0, 'count': submitters}
+    assert all(r is not None and r['count'] <= submitters for r in results)
+    assert len(commits) < submitters
+
+
+def test_failed_batch_raises_and_frees_the_writer(db, monkeypatch):
+    def broken(ratings):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(services, 'submit_ratings', broken)
+
+    with pytest.raises(RuntimeError):
+        RatingService.submit(1, 5)
+    assert RatingService._writing is False
+
+
+def test_removed_tracks_leave_no_orphans(db):
+    populate_tracks(3)
+    for track_id in (1, 2, 3):
+        update_play_count(track_id)
+        submit_ratings([(track_id, 4)])
+        add_telemetry([('ttfa', 0, track_id, 1, 100, 100) + (0,) * len(TELEMETRY_BIN_COLUMNS)])
+    play_rollups.run_once()
+
+    with get_db() as conn:
+        hashes = {r[0]: r[1] for r in conn.execute("SELECT id, file_hash FROM tracks")}
+    assert del_by_unseen_hash({hashes[1], hashes[3]}) == 1
+
+    with get_db() as conn:
+        for table in TRACK_DEPENDENT_TABLES:
+            ids = {r[0] for r in conn.execute(f"SELECT DISTINCT track_id FROM {table}")}
+            assert ids == {1, 3}, table
+        assert conn.execute("SELECT COUNT(*) FROM play_events").fetchone()[0] == 3
+
+
+def test_batch_endpoint_rejects_bad_track_ids(client):
+    populate_tracks(2)
+    rv = client.post('/api/ratings', json={'ratings': [
+        {'track_id': True, 'rating': 5},
+        {'track_id': 2 ** 70, 'rating': 5},
+        {'track_id': 2, 'rating': 4},
+    ]})
+
+    assert rv.status_code == 200
+    assert rv.json['accepted'] == 1 and rv.json['rejected'] == 2
+    assert get_track_rating(1) == {'average': 0.0, 'count': 0}
+    assert get_track_rating(2) == {'average': 4.0, 'count': 1}
+    assert client.post(f'/api/track/{2 ** 70}/rate', json={'rating': 5}).status_code == 404
+
+
+def test_bad_submission_only_fails_its_own_request(db, monkeypatch):
+    populate_tracks(1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_submit(ratings):
+        # Hold the first batch open so every other request queues behind it
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+        return submit_ratings(ratings)
+    monkeypatch.setattr(services, 'submit_ratings', blocking_submit)
+
+    results, errors = [], []
+
+    def rate(pairs):
+        try:
+            results.append(RatingService.submit_many(pairs))
+        except OverflowError as e:
+            errors.append(e)
+
+    first = threading.Thread(target=rate, args=([(1, 5)],))
+    first.start()
+    started.wait(5)
+
+    queued = [threading.Thread(target=rate, args=([(1, 5)],)) for _ in range(9)]
+    queued.append(threading.Thread(target=rate, args=([(1, 5), (2 ** 70, 5)],)))
+    for t in queued:
+        t.start()
+    while len(RatingService._pending) < len(queued):
+        time.sleep(0.01)
+    release.set()
+
+    for t in [first] + queued:
+        t.join()
+
+    assert len(errors) == 1 and len(results) == 10
+    assert get_track_rating(1) == {'average': 5.0, 'count': 10}
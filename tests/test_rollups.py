@@ -0,0 +1,58 @@
+from backend import models
+from backend.models import get_db, update_play_count, del_by_unseen_hash
+from backend.rollups import play_rollups
+from tests.synthetic import populate_tracks
+
+
+def _history(client):
+    rv = client.get('/api/stats/history?period=day')
+    assert rv.status_code == 200
+    return {t['id']: t['plays'] for t in rv.json['top_tracks']}
+
+
+def test_history_reads_do_not_roll_up(client):
+    populate_tracks(3)
+    for track_id in (1, 1, 2):
+        update_play_count(track_id)
+
+    assert _history(client) == {}
+    assert play_rollups.run_once() == 3
+    assert _history(client) == {1: 2, 2: 1}
+
+
+def test_failed_rollup_is_rolled_back_and_retried(client, monkeypatch):
+    populate_tracks(3)
+    for track_id in (1, 2, 3):
+        update_play_count(track_id)
+
+    errors = play_rollups.errors
+    rollup_totals = models.ROLLUP_TOTALS_SQL
+    monkeypatch.setattr(models, 'ROLLUP_TOTALS_SQL', 'INSERT INTO no_such_table VALUES (?, ?, ?, ?, ?)')
+    assert play_rollups.run_once() == 0
+    assert play_rollups.errors == errors + 1
+
+    with get_db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM play_rollups").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM rollup_state").fetchone()[0] == 0
+
+    monkeypatch.setattr(models, 'ROLLUP_TOTALS_SQL', rollup_totals)
+    assert play_rollups.run_once() == 3
+    assert play_rollups.run_once() == 0
+    assert _history(client) == {1: 1, 2: 1, 3: 1}
+
+
+def test_plays_after_removing_a_track_are_rolled_up(client):
+    populate_tracks(3)
+    for track_id in (1, 2, 2):
+        update_play_count(track_id)
+    assert play_rollups.run_once() == 3
+
+    # Track 2 owns the newest event IDs; their rows must not be freed for reuse
+    with get_db() as conn:
+        hashes = {r[0]: r[1] for r in conn.execute("SELECT id, file_hash FROM tracks")}
+    assert del_by_unseen_hash({hashes[1], hashes[3]}) == 1
+
+    update_play_count(3)
+    update_play_count(3)
+    assert play_rollups.run_once() == 2
+    assert _history(client) == {1: 1, 3: 2}
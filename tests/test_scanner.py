@@ -0,0 +1,55 @@
+import os
+from types import SimpleNamespace
+import config
+from backend.models import get_all_tracks
+from scripts import scan_music
+from scripts.scan_music import group_roots_by_device, scan_roots, rescan_music_directory
+from tests.synthetic import write_mp3
+
+
+def _roots(tmp_path, *names):
+    roots = []
+    for name in names:
+        (tmp_path / name).mkdir()
+        roots.append(str(tmp_path / name))
+    return roots
+
+
+def test_group_roots_by_device(tmp_path, monkeypatch):
+    a, b, c = _roots(tmp_path, 'a', 'b', 'c')
+    assert group_roots_by_device([a, b, c]) == [[a, b, c]]
+
+    stat = os.stat
+    devices = {a: 1, b: 2, c: 1}
+    monkeypatch.setattr(scan_music.os, 'stat',
+                        lambda path: SimpleNamespace(st_dev=devices[path]) if path in devices else stat(path))
+    assert group_roots_by_device([a, b, c]) == [[a, c], [b]]
+
+
+def test_scan_roots_reports_every_root(db, tmp_path, monkeypatch):
+    a, b = _roots(tmp_path, 'a', 'b')
+    write_mp3(os.path.join(a, 'one.mp3'), 2)
+    write_mp3(os.path.join(b, 'two.mp3'), 3)
+    # Pretend the roots are on separate disks so they get a worker each
+    monkeypatch.setattr(scan_music, 'group_roots_by_device', lambda roots: [[root] for root in roots])
+
+    results = {root: (files_seen, [t[0] for t in tracks]) for root, files_seen, tracks in scan_roots([a, b])}
+    assert results == {a: (1, ['one.mp3']), b: (1, ['two.mp3'])}
+
+
+def test_tracks_stream_from_their_own_root(client, tmp_path, monkeypatch):
+    a, b = _roots(tmp_path, 'a', 'b')
+    write_mp3(os.path.join(a, 'one.mp3'), 2)
+    write_mp3(os.path.join(b, 'two.mp3'), 3)
+    monkeypatch.setattr(config, 'MUSIC_DIRECTORY', a)
+    monkeypatch.setattr(config, 'MUSIC_DIRECTORIES', [a, b])
+
+    rescan_music_directory()
+
+    tracks = get_all_tracks(1, 50)['tracks']
+    assert sorted((t['music_root'], t['file_path']) for t in tracks) == [(a, 'one.mp3'), (b, 'two.mp3')]
+    for track in tracks:
+        rv = client.get(f"/api/stream/{track['id']}")
+        assert rv.status_code == 200
+        with open(os.path.join(track['music_root'], track['file_path']), 'rb') as f:
+            assert rv.data == f.read()
@@ -0,0 +1,116 @@
+import os
+import pytest
+import config
+from backend.segments import parse_frame_header, iter_frames, split_mp3
+from tests.synthetic import MP3_FRAME_HEADER, MP3_FRAME_SIZE, MP3_FRAME_SECONDS
+
+FRAME = MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+
+
+def _id3v2(body_size, footer=False):
+    size = bytes((body_size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    tag = b'ID3\x04\x00' + bytes([0x10 if footer else 0]) + size + b'\x00' * body_size
+    return tag + (b'3DI' + bytes(7) if footer else b'')
+
+
+def _id3v1():
+    return b'TAG' + b'\xff' * 125
+
+
+@pytest.mark.parametrize('header, expected', [
+    (b'\xff\xfb\x90\x40', (417, 1152, 44100)),   # MPEG-1 Layer III, 128 kbps
+    (b'\xff\xfb\x92\x40', (418, 1152, 44100)),   # same, padded
+    (b'\xff\xf3\x90\x40', (261, 576, 22050)),    # MPEG-2 Layer III, 80 kbps
+    (b'\xff\xfd\x90\x40', (522, 1152, 44100)),   # MPEG-1 Layer II, 160 kbps
+    (b'\xff\xff\x90\x40', (312, 384, 44100)),    # MPEG-1 Layer I, 288 kbps
+])
+def test_parse_frame_header(header, expected):
+    assert parse_frame_header(header, 0) == expected
+
+
+@pytest.mark.parametrize('header', [
+    b'\xff\xfb\x00\x40',   # free format bitrate
+    b'\xff\xfb\xf0\x40',   # bad bitrate
+    b'\xff\xfb\x9c\x40',   # reserved sample rate
+    b'\xff\xeb\x90\x40',   # reserved version
+    b'\xff\xf9\x90\x40',   # reserved layer
+    b'\xfe\xfb\x90\x40',   # no sync
+    b'\xff\xfb\x90',       # truncated
+])
+def test_parse_frame_header_rejects(header):
+    assert parse_frame_header(header, 0) is None
+
+
+def test_iter_frames_skips_tags():
+    for head in (_id3v2(100), _id3v2(37, footer=True)):
+        data = head + FRAME * 3 + _id3v1()
+        assert [pos for pos, _, _ in iter_frames(data)] == [len(head) + i * MP3_FRAME_SIZE for i in range(3)]
+
+
+def test_iter_frames_resyncs_after_garbage():
+    # Stray sync bytes in the garbage must not be taken for a frame
+    garbage = b'\x00\xff\xfb\x90\x40\x12\xff\x00' * 4
+    data = FRAME * 2 + garbage + FRAME * 2
+
+    positions = [pos for pos, _, _ in iter_frames(data)]
+    after = 2 * MP3_FRAME_SIZE + len(garbage)
+    assert positions == [0, MP3_FRAME_SIZE, after, after + MP3_FRAME_SIZE]
+
+
+def test_iter_frames_ignores_truncated_last_frame():
+    data = FRAME * 2 + FRAME[:100]
+    assert len(list(iter_frames(data))) == 2
+
+
+def test_split_mp3_covers_the_whole_file():
+    data = _id3v2(200) + FRAME * 700 + _id3v1()
+    offsets, durations = split_mp3(data, 6)
+
+    assert offsets[0] == 0 and offsets[-1] == len(data)
+    assert offsets == sorted(set(offsets))
+    assert len(durations) == len(offsets) - 1
+    assert sum(durations) == pytest.approx(700 * MP3_FRAME_SECONDS, abs=0.01)
+    assert all(d >= 6 for d in durations[:-1]) and all(d < 6 + MP3_FRAME_SECONDS for d in durations[:-1])
+
+    frames = {pos for pos, _, _ in iter_frames(data)}
+    assert set(offsets[1:-1]) <= frames
+    assert b''.join(data[a:b] for a, b in zip(offsets, offsets[1:])) == data
+
+
+def test_split_mp3_without_frames():
+    assert split_mp3(_id3v2(50) + bytes(1000), 6) is None
+    assert split_mp3(b'', 6) is None
+
+
+def test_segments_reassemble_the_file(client, add_mp3, db, monkeypatch):
+    monkeypatch.setattr(config, 'SEGMENTS_ENABLED', True)
+    track_id = add_mp3('a.mp3', seconds=20)
+
+    playlist = client.get(f'/api/stream/{track_id}/playlist.m3u8')
+    assert playlist.status_code == 200
+    urls = [line for line in playlist.text.splitlines() if line.startswith('/api/segment/')]
+    assert len(urls) == 4
+
+    body = b''.join(client.get(url).data for url in urls)
+    assert body == (db / 'a.mp3').read_bytes()
+
+
+def test_changed_file_is_not_served_from_a_stale_index(client, add_mp3, db, monkeypatch):
+    monkeypatch.setattr(config, 'SEGMENTS_ENABLED', True)
+    track_id = add_mp3('a.mp3', seconds=20)
+    path = db / 'a.mp3'
+
+    playlist = client.get(f'/api/stream/{track_id}/playlist.m3u8')
+    url = [line for line in playlist.text.splitlines() if line.startswith('/api/segment/')][0]
+    rv = client.get(url)
+    assert rv.status_code == 200
+    assert client.get(url, headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+
+    # Same size, new mtime: the stored offsets can't be trusted any more
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert client.get(url).status_code == 404
+
+    # Fetching the playlist re-indexes the file
+    assert client.get(f'/api/stream/{track_id}/playlist.m3u8').status_code == 200
+    assert client.get(url).data == rv.data
@@ -0,0 +1,47 @@
+import pytest
+import config
+from backend.shaping import stream_shaper
+
+
+@pytest.fixture
+def shaping(monkeypatch):
+    monkeypatch.setattr(config, 'STREAM_SHAPING_ENABLED', True)
+    monkeypatch.setattr(config, 'STREAM_MAX_PER_CLIENT', 2)
+    monkeypatch.setattr(config, 'STREAM_CLIENT_RATE', 1024 * 1024 * 1024)
+    monkeypatch.setattr(config, 'STREAM_GLOBAL_RATE', 1024 * 1024 * 1024)
+
+
+def test_head_requests_release_stream_slot(client, add_mp3, shaping):
+    track_id = add_mp3('a.mp3')
+
+    # The test client, like a WSGI server, closes the body without iterating it
+    for _ in range(5):
+        with client.head(f'/api/stream/{track_id}') as rv:
+            assert rv.status_code == 200
+
+    assert stream_shaper.stats()['active_streams'] == 0
+    with client.get(f'/api/stream/{track_id}') as rv:
+        assert rv.status_code == 200
+
+
+def test_unconsumed_body_releases_slot_on_close(client, add_mp3, shaping):
+    track_id = add_mp3('a.mp3')
+
+    responses = [client.get(f'/api/stream/{track_id}', buffered=False) for _ in range(2)]
+    assert client.get(f'/api/stream/{track_id}').status_code == 429
+
+    for rv in responses:
+        rv.close()
+    assert stream_shaper.stats()['active_streams'] == 0
+    assert client.get(f'/api/stream/{track_id}').status_code == 200
+
+
+def test_shaped_body_matches_file(client, add_mp3, db, shaping):
+    track_id = add_mp3('a.mp3')
+    data = (db / 'a.mp3').read_bytes()
+
+    with client.get(f'/api/stream/{track_id}') as rv:
+        assert rv.data == data
+    with client.get(f'/api/stream/{track_id}', headers={'Range': 'bytes=1000-1999'}) as rv:
+        assert rv.status_code == 206 and rv.data == data[1000:2000]
+    assert stream_shaper.stats()['active_streams'] == 0
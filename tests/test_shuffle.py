@@ -0,0 +1,63 @@
+import random
+import pytest
+import config
+from backend.shuffle import AliasTable, track_weight, weighted_sampler
+from backend.services import TrackService
+from tests.synthetic import populate_tracks
+
+
+def test_alias_table_matches_weights():
+    weights = [1.0, 2.0, 3.0, 4.0]
+    table = AliasTable(weights)
+    rng = random.Random(7)
+
+    counts = [0] * len(weights)
+    draws = 100000
+    for _ in range(draws):
+        counts[table.sample(rng)] += 1
+
+    for count, weight in zip(counts, weights):
+        assert count / draws == pytest.approx(weight / sum(weights), abs=0.01)
+
+
+def test_alias_table_never_draws_zero_weight():
+    table = AliasTable([0.0, 1.0, 0.0, 1.0])
+    rng = random.Random(1)
+    assert {table.sample(rng) for _ in range(10000)} == {1, 3}
+
+
+def test_alias_table_handles_single_and_empty():
+    assert AliasTable([5.0]).sample(random.Random(0)) == 0
+    assert AliasTable([]).n == 0
+
+
+def test_track_weight_penalises_plays_and_recency():
+    now = 1_000_000
+    hours = config.WEIGHTED_SHUFFLE_RECENCY_HOURS
+
+    assert track_weight(0, 0, now) == 1.0
+    assert track_weight(3, 0, now) == 0.25
+    assert track_weight(0, now, now) == config.WEIGHTED_SHUFFLE_RECENCY_FLOOR
+    assert track_weight(0, now - hours * 1800, now) == pytest.approx(0.5)
+    assert track_weight(0, now - hours * 7200, now) == 1.0
+
+
+def test_pick_respects_exclusions(db):
+    populate_tracks(20, seed=3)
+    weighted_sampler.rebuild()
+
+    excluded = set(range(1, 11))
+    picks = {weighted_sampler.pick(excluded) for _ in range(200)}
+    assert picks and picks <= set(range(11, 21))
+    assert weighted_sampler.pick(set(range(1, 21))) is None
+
+
+def test_fully_excluded_pick_does_not_trigger_rebuild(db, monkeypatch):
+    monkeypatch.setattr(config, 'WEIGHTED_SHUFFLE_ENABLED', True)
+    populate_tracks(3, seed=3)
+    weighted_sampler.rebuild()
+
+    TrackService.recently_played.extend([1, 2, 3])
+    TrackService._get_weighted_track()
+
+    assert weighted_sampler._stale is False
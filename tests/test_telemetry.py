@@ -0,0 +1,88 @@
+import sqlite3
+import pytest
+from backend import telemetry as telemetry_module
+from backend.models import get_db
+from backend.telemetry import telemetry
+from tests.synthetic import populate_tracks
+
+
+def _post(client, events):
+    rv = client.post('/api/telemetry', json={'events': events})
+    assert rv.status_code == 202
+    return rv.json
+
+
+def _rollup_rows():
+    with get_db() as conn:
+        return {r[0]: r[1] for r in conn.execute("SELECT track_id, count FROM telemetry_rollups")}
+
+
+def test_post_and_get(client):
+    populate_tracks(3)
+    assert _post(client, [
+        {'type': 'ttfa', 'track_id': 1, 'ms': 300},
+        {'type': 'ttfa', 'track_id': 1, 'ms': 700},
+        {'type': 'ttfa', 'track_id': 2, 'ms': 4000},
+        {'type': 'error', 'track_id': 3},
+    ]) == {'accepted': 4, 'rejected': 0}
+
+    rv = client.get('/api/telemetry?metric=ttfa')
+    assert rv.status_code == 200
+    assert [h['count'] for h in rv.json['hours']] == [3]
+    assert [(t['track_id'], t['count'], t['mean_ms']) for t in rv.json['tracks']] == [(2, 1, 4000), (1, 2, 500)]
+    assert client.get('/api/telemetry?metric=error&track_id=3').json['hours'][0]['count'] == 1
+    assert client.get('/api/telemetry?metric=nope').status_code == 400
+
+
+@pytest.mark.parametrize('event', [
+    {'type': 'ttfa', 'track_id': True, 'ms': 10},
+    {'type': 'ttfa', 'track_id': 2 ** 70, 'ms': 10},
+    {'type': 'ttfa', 'track_id': 2 ** 63, 'ms': 10},
+    {'type': 'ttfa', 'track_id': 0, 'ms': 10},
+    {'type': 'ttfa', 'track_id': '1', 'ms': 10},
+    {'type': 'ttfa', 'track_id': 1, 'ms': -1},
+    {'type': 'ttfa', 'track_id': 1, 'ms': True},
+    {'type': 'buffering', 'track_id': 1, 'ms': 10},
+    'ttfa',
+])
+def test_malformed_events_are_rejected(client, event):
+    assert _post(client, [event]) == {'accepted': 0, 'rejected': 1}
+
+
+def test_rejects_oversized_batches(client):
+    assert client.post('/api/telemetry', json={'events': [{}] * 101}).status_code == 400
+    assert client.post('/api/telemetry', data='not json').status_code == 400
+
+
+def test_unknown_tracks_are_not_stored(client):
+    populate_tracks(5)
+    _post(client, [{'type': 'ttfa', 'track_id': i, 'ms': 100} for i in range(1, 100)])
+    telemetry.flush()
+    assert set(_rollup_rows()) == {1, 2, 3, 4, 5}
+
+
+def test_busy_database_keeps_histograms_for_retry(db, monkeypatch):
+    populate_tracks(2)
+    telemetry.record([('ttfa', 1, 100), ('ttfa', 2, 200)])
+
+    def busy(rows):
+        raise sqlite3.OperationalError('database is locked')
+    add_telemetry = telemetry_module.add_telemetry
+    monkeypatch.setattr(telemetry_module, 'add_telemetry', busy)
+    assert telemetry.flush() == 0
+    assert telemetry.stats()['pending_histograms'] == 2
+
+    monkeypatch.setattr(telemetry_module, 'add_telemetry', add_telemetry)
+    assert telemetry.flush() == 2
+    assert _rollup_rows() == {1: 1, 2: 1}
+
+
+def test_rejected_row_is_dropped_not_retried(db, monkeypatch):
+    populate_tracks(5)
+    telemetry.record([('ttfa', 5, 100), ('ttfa', 2 ** 70, 100)])
+
+    bad_rows = telemetry.bad_rows
+    assert telemetry.flush() == 1
+    assert telemetry.bad_rows == bad_rows + 1
+    assert telemetry.stats()['pending_histograms'] == 0
+    assert _rollup_rows() == {5: 1}